@@ -0,0 +1,163 @@
+"""
+Admission control for the expensive endpoints.
+
+Each limited route has its own concurrency limit and a short wait queue, and
+every admitted request also draws its route's cost weight from one shared
+budget, so a handful of full-table requests cannot push the worker into swap.
+When a queue is full the request is rejected straight away with 429; when it
+waits longer than ADMISSION_QUEUE_TIMEOUT seconds it gets 503. Both carry a
+Retry-After header.
+
+Environment:
+  ADMISSION_COST_BUDGET    - total cost units in flight per worker (default 8)
+  ADMISSION_QUEUE_TIMEOUT  - max seconds a request waits in a queue (default 2)
+  ADMISSION_RETRY_AFTER    - Retry-After value in seconds (default 2)
+"""
+
+import asyncio
+import functools
+import os
+from collections import deque
+
+from fastapi.responses import JSONResponse
+
+COST_BUDGET = int(os.getenv("ADMISSION_COST_BUDGET", 8))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 2))
+RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 2))
+
+# Per-route policy: concurrent requests, queued requests, cost weight against COST_BUDGET
+ROUTE_POLICIES = {
+    "transformers": {"max_concurrent": 2, "max_queue": 4, "cost": 4},
+    "view_data": {"max_concurrent": 4, "max_queue": 8, "cost": 2},
+    "view_map": {"max_concurrent": 4, "max_queue": 8, "cost": 1},
+    "view_bundle": {"max_concurrent": 4, "max_queue": 8, "cost": 2},
+    "filtered_map_data": {"max_concurrent": 4, "max_queue": 8, "cost": 2},
+    "homepage_map_data": {"max_concurrent": 4, "max_queue": 8, "cost": 2},
+    "map": {"max_concurrent": 4, "max_queue": 8, "cost": 1},
+}
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code, reason):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+
+
+class Limiter:
+    """Weighted semaphore with a bounded FIFO wait queue (event-loop only, not thread-safe)"""
+
+    def __init__(self, name, capacity, max_queue):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.in_use = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self._waiters = deque()
+
+    async def acquire(self, cost, timeout):
+        cost = min(cost, self.capacity)
+        if not self._waiters and self.in_use + cost <= self.capacity:
+            self.in_use += cost
+            self.admitted += 1
+            return cost
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            raise Overloaded(429, f"{self.name} queue is full")
+        future = asyncio.get_event_loop().create_future()
+        waiter = (cost, future)
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                # Admitted just as the timeout fired
+                return cost
+            future.cancel()
+            self._waiters.remove(waiter)
+            self.shed_timeout += 1
+            raise Overloaded(503, f"{self.name} queue wait timed out")
+        except asyncio.CancelledError:
+            # Client went away while queued: give back a slot handed over meanwhile
+            if future.done():
+                self.release(cost)
+            else:
+                future.cancel()
+                self._waiters.remove(waiter)
+            raise
+        return cost
+
+    def release(self, cost):
+        self.in_use -= cost
+        while self._waiters and self.in_use + self._waiters[0][0] <= self.capacity:
+            cost, future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_use += cost
+            self.admitted += 1
+            future.set_result(True)
+
+    def status(self):
+        return {
+            "in_use": self.in_use,
+            "capacity": self.capacity,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+        }
+
+
+budget = Limiter("cost budget", COST_BUDGET, max_queue=sum(p["max_queue"] for p in ROUTE_POLICIES.values()))
+route_limiters = {
+    name: Limiter(name, policy["max_concurrent"], policy["max_queue"])
+    for name, policy in ROUTE_POLICIES.items()
+}
+
+
+def overloaded_response(error):
+    return JSONResponse(
+        status_code=error.status_code,
+        content={"error": "Server busy, please retry", "reason": error.reason},
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
+
+
+def limit(route):
+    """Decorator for async handlers: admit through `route`'s limiter and the shared cost budget"""
+    limiter = route_limiters[route]
+    cost = ROUTE_POLICIES[route]["cost"]
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + QUEUE_TIMEOUT
+            try:
+                slot = await limiter.acquire(1, QUEUE_TIMEOUT)
+            except Overloaded as e:
+                return overloaded_response(e)
+            try:
+                try:
+                    weight = await budget.acquire(cost, max(deadline - loop.time(), 0))
+                except Overloaded as e:
+                    return overloaded_response(e)
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    budget.release(weight)
+            finally:
+                limiter.release(slot)
+        return wrapper
+    return decorator
+
+
+def status():
+    """Queue depth, in-flight cost and shed counts per route"""
+    return {
+        "cost_budget": budget.status(),
+        "routes": {name: limiter.status() for name, limiter in route_limiters.items()},
+    }
@@ -1,14 +1,26 @@
 from fastapi import FastAPI, Query, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 import pandas as pd
 import json
 import os
 import subprocess
 import sys
-import sqlite3
-from typing import Optional, List
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import List
 from pydantic import BaseModel
 
+from dataset_store import DATA_DIR, get_snapshot, get_schema, publish_dataset, clean_records, encode_json
+from refresh_scheduler import RefreshScheduler, schedule_from_env
+import admission
+import cpu_pool
+import view_cache
+import views_db
+from cpu_pool import cpu_bound
+
 app = FastAPI(title="Genius DB API")
 
 # Add CORS middleware
@@ -39,17 +51,78 @@ class ViewDataResponse(BaseModel):
     selected_columns: List[str]
     data: List[dict]
 
-# Load data files
-DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# Scheduled refresh (configured via DATA_REFRESH_CRON / DATA_REFRESH_INTERVAL)
+refresh_scheduler = None
+_refresh_lock = threading.Lock()
+
+# Startup warm-up progress, reported by /ready
+warmup_state = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "dataset_version": None,
+    "timings_ms": None,
+    "error": None,
+}
+
+def run_startup_warmup():
+    """Load the current dataset version and build its caches before reporting ready"""
+    warmup_state["started_at"] = datetime.now().isoformat()
+    start = time.perf_counter()
+    try:
+        snapshot = get_snapshot()
+        timings = {"load_dataset": round((time.perf_counter() - start) * 1000, 2)}
+        timings.update(warm_dataset(snapshot))
+        timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+        warmup_state.update(dataset_version=snapshot.version, timings_ms=timings, error=None)
+        warmup_state["ready"] = True
+        print(f"Warm-up finished in {timings['total']} ms: {timings}")
+    except Exception as e:
+        traceback.print_exc()
+        warmup_state["error"] = str(e)
+    finally:
+        warmup_state["finished_at"] = datetime.now().isoformat()
+
+# on_event hooks: the pinned FastAPI 0.68 has no lifespan= argument
+@app.on_event("startup")
+def start_warmup():
+    # Warm up in the background so /health answers while /ready still reports not ready
+    threading.Thread(target=run_startup_warmup, name="startup-warmup", daemon=True).start()
+
+@app.on_event("startup")
+def start_refresh_scheduler():
+    global refresh_scheduler
+    schedule = schedule_from_env()
+    if schedule is not None:
+        refresh_scheduler = RefreshScheduler(refresh_dataset, schedule)
+        refresh_scheduler.start()
+        print(f"Scheduled data refresh enabled: {refresh_scheduler.status()['schedule']}")
+
+@app.on_event("shutdown")
+def stop_refresh_scheduler():
+    if refresh_scheduler is not None:
+        refresh_scheduler.stop()
+    cpu_pool.shutdown()
+    views_db.close_all()
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to Genius DB API"}
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """503 until the dataset is loaded and its caches are built"""
+    status = dict(warmup_state)
+    if not status["ready"]:
+        status["status"] = "warming_up" if status["error"] is None else "warmup_failed"
+        return JSONResponse(status_code=503, content=status)
+    status["status"] = "ready"
+    return status
+
 @app.get("/data/columns")
 def get_columns():
     try:
@@ -59,6 +132,14 @@ def get_columns():
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/api/schema")
+def get_dataset_schema():
+    """Column names, dtypes, nullability and categorical flags of the published dataset"""
+    try:
+        return get_schema().as_dict()
+    except Exception as e:
+        return {"error": str(e)}
+
 @app.get("/data/aggregated")
 def get_aggregated_data():
     try:
@@ -78,127 +159,46 @@ def get_calculated_data():
         return {"error": str(e)}
 
 @app.get("/data/map")
+@admission.limit("map")
+@cpu_bound
 def get_map_data():
     try:
-        # Read the CSV file
-        df = pd.read_csv(os.path.join(DATA_DIR, "transformed_transformer_data.csv"))
-        
-        # Extract map data with coordinates
-        map_data = []
-        for index, row in df.iterrows():
-            # Get spatial coordinates
-            spatial_coords = row.get('Spatial Coordinates')
-            if pd.isna(spatial_coords) or spatial_coords == '\\N':
-                continue
-                
-            # Parse coordinates (format: "lat, lng")
-            try:
-                coords = spatial_coords.strip('"').split(', ')
-                if len(coords) == 2:
-                    lat = float(coords[0])
-                    lng = float(coords[1])
-                    
-                    # Skip invalid coordinates
-                    if pd.isna(lat) or pd.isna(lng):
-                        continue
-                    
-                    # Get site name
-                    site_name = row.get('Site Name', f'Site {index}')
-                    if pd.isna(site_name):
-                        site_name = f'Site {index}'
-                    
-                    # Get additional information
-                    site_type = row.get('Site Type', 'Unknown')
-                    if pd.isna(site_type):
-                        site_type = 'Unknown'
-                        
-                    site_voltage = row.get('Site Voltage', 'Unknown')
-                    if pd.isna(site_voltage):
-                        site_voltage = 'Unknown'
-                        
-                    county = row.get('County', 'Unknown')
-                    if pd.isna(county):
-                        county = 'Unknown'
-                    
-                    # Get Generation Headroom Mw value
-                    generation_headroom = row.get('Generation Headroom Mw', None)
-                    if pd.isna(generation_headroom):
-                        generation_headroom = None
-                    
-                    # Get Bulk Supply Point
-                    bulk_supply_point = row.get('Bulk Supply Point', None)
-                    if pd.isna(bulk_supply_point):
-                        bulk_supply_point = None
-                        
-                    # Get Constraint Description
-                    constraint_description = row.get('Constraint description', None)
-                    if pd.isna(constraint_description):
-                        constraint_description = None
-                        
-                    # Get Licence Area (Network Operator)
-                    licence_area = row.get('Licence Area', None)
-                    if pd.isna(licence_area):
-                        licence_area = None
-                    
-                    map_data.append({
-                        "id": index,
-                        "position": [lat, lng],
-                        "site_name": site_name,
-                        "site_type": site_type,
-                        "site_voltage": site_voltage,
-                        "county": county,
-                        "generation_headroom": generation_headroom,
-                        "popup_text": f"{site_name} ({site_type})",
-                        "bulk_supply_point": bulk_supply_point,
-                        "constraint_description": constraint_description,
-                        "licence_area": licence_area
-                    })
-            except (ValueError, IndexError):
-                # Skip rows with invalid coordinates
-                continue
-                
-        return map_data
+        return get_snapshot().artifact("map_records")
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/data/map/geojson")
+@admission.limit("map")
+@cpu_bound
+def get_map_geojson():
+    try:
+        return get_snapshot().artifact("geojson")
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/data/facets")
+@cpu_bound
+def get_facets():
+    """Value counts for the filterable columns (site voltage, licence area, ...)"""
+    try:
+        return get_snapshot().artifact("facets")
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/data/transformers")
+@admission.limit("transformers")
+@cpu_bound
 def get_transformer_data():
     try:
-        # Read the CSV file
-        df = pd.read_csv(os.path.join(DATA_DIR, "transformed_transformer_data.csv"))
-        
-        # Comprehensive NaN and infinite value handling
-        # Replace infinite values with None
-        df = df.replace([float('inf'), float('-inf')], None)
-        
-        # Replace NaN values with None using multiple approaches
-        df = df.where(pd.notna(df), None)
-        
-        # Additional check for any remaining problematic values
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                # For object columns, replace any string representations of nan
-                df[col] = df[col].replace(['nan', 'NaN', 'null', 'None'], None)
-        
-        # Convert DataFrame to list of dictionaries
-        transformer_data = df.to_dict('records')
-        
-        # Additional cleaning of the records to ensure JSON compliance
-        for record in transformer_data:
-            for key, value in record.items():
-                # Check for any remaining float values that might be problematic
-                if isinstance(value, float):
-                    if pd.isna(value):  # Use pd.isna instead of pd.isfinite
-                        record[key] = None
-        
-        return transformer_data
+        # The full table is encoded once per dataset version and served as raw bytes
+        payload = get_snapshot().artifact("transformers_payload")
+        return Response(content=payload, media_type="application/json")
     except Exception as e:
         return {"error": str(e)}
 
-@app.get("/process/transformers")
-def process_transformer_data():
+def run_pipeline():
+    """Run the grid_and_primary_calculated.py script"""
     try:
-        # Run the grid_and_primary_calculated.py script
         # Get the directory of the current script
         current_dir = os.path.dirname(os.path.abspath(__file__))
         script_path = os.path.join(current_dir, "grid_and_primary_calculated.py")
@@ -216,40 +216,147 @@ def process_transformer_data():
     except Exception as e:
         return {"status": "error", "message": f"Failed to execute script: {str(e)}"}
 
+def warm_dataset(snapshot):
+    """Pre-build every derived artifact and saved-view result for a dataset version"""
+    timings = snapshot.warm()
+    start = time.perf_counter()
+    warmed_views = warm_saved_views(snapshot)
+    timings["saved_views"] = round((time.perf_counter() - start) * 1000, 2)
+    timings["saved_views_count"] = warmed_views
+    return timings
+
+def refresh_dataset():
+    """Run the pipeline, publish the new dataset version and pre-warm its caches"""
+    if not _refresh_lock.acquire(blocking=False):
+        return {"status": "error", "message": "A data refresh is already in progress"}
+    try:
+        result = run_pipeline()
+        if result["status"] != "success":
+            return result
+        snapshot = publish_dataset()
+        result["version"] = snapshot.version
+        result["warmup_ms"] = warm_dataset(snapshot)
+        if not warmup_state["ready"]:
+            # A successful refresh also recovers a worker whose startup warm-up failed
+            warmup_state.update(ready=True, dataset_version=snapshot.version, timings_ms=result["warmup_ms"], error=None)
+        return result
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to publish refreshed data: {str(e)}"}
+    finally:
+        _refresh_lock.release()
+
+@app.get("/process/transformers")
+def process_transformer_data():
+    return refresh_dataset()
+
+@app.get("/process/profile")
+def get_pipeline_profile():
+    """Per-stage wall/CPU time, rows and memory of the last pipeline run"""
+    try:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline_profile.json")) as f:
+            return json.load(f)
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.get("/admission/status")
+async def get_admission_status():
+    """Queue depth, in-flight cost and shed counts of the admission-controlled routes"""
+    return admission.status()
+
+@app.get("/process/status")
+def get_refresh_status():
+    """Scheduled refresh configuration and the outcome of its last run"""
+    status = refresh_scheduler.status() if refresh_scheduler is not None else {"enabled": False}
+    status["running"] = _refresh_lock.locked()
+    status["view_cache"] = view_cache.status()
+    try:
+        status["dataset_version"] = get_snapshot().version
+    except Exception as e:
+        status["dataset_version"] = None
+        status["error"] = str(e)
+    return status
+
 @app.get("/api/user/views")
 def get_user_views(user_id: int = Query(1)):
     """Get all saved views for a user (max 5)"""
     try:
-        conn = sqlite3.connect("user_views.db")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, slot, name, selected_columns, chart_config, filters, created_at, updated_at 
-            FROM user_views 
-            WHERE user_id = ? 
-            ORDER BY slot
-        """, (user_id,))
+        views = views_db.list_user_views(user_id)
         
-        views = cursor.fetchall()
-        conn.close()
+        # The user will most likely open one of their views next
+        schedule_view_prefetch(user_id)
         
         # Convert to list of dictionaries
-        result = []
-        for view in views:
-            result.append({
-                "slot": view["slot"],
-                "name": view["name"],
-                "selected_columns": view["selected_columns"],  # Keep as CSV string
-                "chart_config": view["chart_config"],  # Keep as string
-                "filters": view["filters"],  # Keep as JSON string
-                "updated_at": view["updated_at"]
-            })
+        result = [user_view_dict(view) for view in views]
         
         return {"views": result}
     except Exception as e:
         return {"error": str(e)}
 
+def user_view_dict(view):
+    """API representation of a user_views row"""
+    return {
+        "slot": view["slot"],
+        "name": view["name"],
+        "selected_columns": view["selected_columns"],  # Keep as CSV string
+        "chart_config": view["chart_config"],  # Keep as string
+        "filters": view["filters"],  # Keep as JSON string
+        "updated_at": view["updated_at"]
+    }
+
+# Must be declared before /api/user/views/{slot}, which would otherwise capture "bundle"
+@app.get("/api/user/views/bundle")
+@admission.limit("view_bundle")
+@cpu_bound
+def get_user_views_bundle(user_id: int = Query(1), data_slots: str = Query("")):
+    """
+    All of a user's view definitions in one response, plus the projected data of
+    the slots listed in `data_slots` (comma-separated), taken from one snapshot
+    """
+    try:
+        requested_slots = {int(slot) for slot in data_slots.split(",") if slot.strip()}
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "data_slots must be a comma-separated list of slot numbers"})
+    
+    try:
+        views = views_db.list_user_views(user_id)
+        saved_views = views_db.list_saved_views(user_id)
+        snapshot = get_snapshot()
+        
+        # Validate against allowed dataset columns, like the per-view endpoints
+        allowed_columns = get_allowed_columns()
+        projections = {}
+        for view in views:
+            if view["slot"] in requested_slots:
+                selected_columns = view["selected_columns"].split(",") if view["selected_columns"] else []
+                projections[view["slot"]] = [col for col in selected_columns if col in allowed_columns]
+        
+        data = {}
+        if projections:
+            # One projection pass over the union of columns, then sliced per view
+            union_columns = list(dict.fromkeys(col for cols in projections.values() for col in cols))
+            records = build_view_data(snapshot, union_columns) if union_columns else []
+            for slot, cols in projections.items():
+                data[str(slot)] = {
+                    "selected_columns": cols,
+                    "data": [{col: record[col] for col in cols} for record in records] if cols else []
+                }
+        
+        return {
+            "dataset_version": snapshot.version,
+            "views": [user_view_dict(view) for view in views],
+            "saved_views": [
+                {
+                    "view_name": view["view_name"],
+                    "selected_columns": view["selected_columns"].split(",") if view["selected_columns"] else [],
+                    "created_at": view["created_at"]
+                }
+                for view in saved_views
+            ],
+            "data": data
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
 @app.get("/api/user/views/{slot}")
 def get_user_view(slot: int, user_id: int = Query(1)):
     """Get a specific saved view for a user by slot"""
@@ -258,33 +365,13 @@ def get_user_view(slot: int, user_id: int = Query(1)):
         if slot < 1 or slot > 5:
             return {"error": "Slot must be between 1 and 5"}, 400
             
-        conn = sqlite3.connect("user_views.db")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, slot, name, selected_columns, chart_config, filters, created_at, updated_at 
-            FROM user_views 
-            WHERE user_id = ? AND slot = ?
-        """, (user_id, slot))
-        
-        view = cursor.fetchone()
-        conn.close()
+        view = views_db.get_user_view(user_id, slot)
         
         if not view:
             return {"error": "View not found"}, 404
             
         # Convert to dictionary
-        result = {
-            "slot": view["slot"],
-            "name": view["name"],
-            "selected_columns": view["selected_columns"],  # Keep as CSV string
-            "chart_config": view["chart_config"],  # Keep as string
-            "filters": view["filters"],  # Keep as JSON string
-            "updated_at": view["updated_at"]
-        }
-        
-        return result
+        return user_view_dict(view)
     except Exception as e:
         return {"error": str(e)}
 
@@ -324,33 +411,9 @@ def save_user_view(
             except Exception:
                 return {"error": "Invalid filters format"}, 400
             
-        conn = sqlite3.connect("user_views.db")
-        cursor = conn.cursor()
-        
-        # Check if a view already exists in this slot for this user
-        cursor.execute("""
-            SELECT id FROM user_views 
-            WHERE user_id = ? AND slot = ?
-        """, (user_id, slot))
-        
-        existing_view = cursor.fetchone()
-        
-        if existing_view:
-            # Update existing view
-            cursor.execute("""
-                UPDATE user_views 
-                SET name = ?, selected_columns = ?, chart_config = ?, filters = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = ? AND slot = ?
-            """, (view_data.name, view_data.selected_columns, view_data.chart_config, view_data.filters, user_id, slot))
-        else:
-            # Insert new view
-            cursor.execute("""
-                INSERT INTO user_views (user_id, slot, name, selected_columns, chart_config, filters)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (user_id, slot, view_data.name, view_data.selected_columns, view_data.chart_config, view_data.filters))
-        
-        conn.commit()
-        conn.close()
+        # Insert or replace the view in this slot in one statement
+        views_db.upsert_user_view(user_id, slot, view_data.name, view_data.selected_columns,
+                                  view_data.chart_config, view_data.filters)
         
         return {
             "slot": slot,
@@ -371,16 +434,7 @@ def delete_user_view(slot: int, user_id: int = Query(1)):
         if slot < 1 or slot > 5:
             return {"error": "Slot must be between 1 and 5"}, 400
             
-        conn = sqlite3.connect("user_views.db")
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            DELETE FROM user_views 
-            WHERE user_id = ? AND slot = ?
-        """, (user_id, slot))
-        
-        conn.commit()
-        conn.close()
+        views_db.delete_user_view(user_id, slot)
         
         return {"message": f"View slot {slot} cleared successfully"}
     except Exception as e:
@@ -408,33 +462,9 @@ def save_update_view(view_name: str, view_data: NewViewData):
         # Convert selected columns to comma-separated string
         selected_columns_str = ",".join(view_data.selected_columns)
         
-        conn = sqlite3.connect("user_views.db")
-        cursor = conn.cursor()
-        
-        # Check if a view already exists with this name for this user
-        cursor.execute("""
-            SELECT id FROM saved_views 
-            WHERE user_id = ? AND view_name = ?
-        """, (view_data.user_id, view_name))
-        
-        existing_view = cursor.fetchone()
-        
-        if existing_view:
-            # Update existing view
-            cursor.execute("""
-                UPDATE saved_views 
-                SET selected_columns = ?, created_at = CURRENT_TIMESTAMP
-                WHERE user_id = ? AND view_name = ?
-            """, (selected_columns_str, view_data.user_id, view_name))
-        else:
-            # Insert new view
-            cursor.execute("""
-                INSERT INTO saved_views (user_id, view_name, selected_columns)
-                VALUES (?, ?, ?)
-            """, (view_data.user_id, view_name, selected_columns_str))
-        
-        conn.commit()
-        conn.close()
+        # Insert or update the named view in one statement
+        views_db.upsert_saved_view(view_data.user_id, view_name, selected_columns_str)
+        view_cache.invalidate_view(view_data.user_id, view_name)
         
         return {
             "message": f"View '{view_name}' saved successfully",
@@ -446,6 +476,8 @@ def save_update_view(view_name: str, view_data: NewViewData):
         return {"error": f"Failed to save view: {str(e)}"}, 500
 
 @app.get("/api/views/{view_name}/data")
+@admission.limit("view_data")
+@cpu_bound
 def load_view_data(view_name: str, user_id: int = Query(...)):
     """Load a view with filtered data"""
     try:
@@ -455,17 +487,7 @@ def load_view_data(view_name: str, user_id: int = Query(...)):
             return {"error": "View name must be one of: View 1, View 2, View 3, View 4, View 5"}, 400
             
         # Fetch saved view from DB
-        conn = sqlite3.connect("user_views.db")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT selected_columns FROM saved_views 
-            WHERE user_id = ? AND view_name = ?
-        """, (user_id, view_name))
-        
-        view = cursor.fetchone()
-        conn.close()
+        view = views_db.get_saved_view(user_id, view_name)
         
         if not view:
             return {"error": "View not found"}, 404
@@ -483,28 +505,9 @@ def load_view_data(view_name: str, user_id: int = Query(...)):
         if not validated_columns:
             return {"error": "No valid columns found in view"}, 400
             
-        # Read the CSV file
-        df = pd.read_csv(os.path.join(DATA_DIR, "transformed_transformer_data.csv"))
-        
-        # Filter DataFrame to only include selected columns
-        filtered_df = df[validated_columns]
-        
-        # Handle NaN and infinite values to make them JSON compliant
-        # Replace infinite values with None
-        filtered_df = filtered_df.replace([float('inf'), float('-inf')], None)
-        
-        # Replace NaN values with None
-        filtered_df = filtered_df.where(pd.notna(filtered_df), None)
-        
-        # Convert DataFrame to list of dictionaries
-        filtered_data = filtered_df.to_dict('records')
-        
-        return {
-            "view_name": view_name,
-            "user_id": user_id,
-            "selected_columns": validated_columns,
-            "data": filtered_data
-        }
+        # The encoded response is materialized per view definition and dataset version
+        payload = view_data_payload(get_snapshot(), user_id, view_name, selected_columns_str, validated_columns)
+        return Response(content=payload, media_type="application/json")
     except Exception as e:
         # Log the full error for debugging
         import traceback
@@ -514,6 +517,8 @@ def load_view_data(view_name: str, user_id: int = Query(...)):
         return {"error": f"Failed to load view data: {str(e)}"}, 500
 
 @app.get("/api/views/{view_name}/map")
+@admission.limit("view_map")
+@cpu_bound
 def get_map_view(view_name: str, user_id: int = Query(...)):
     """Get map markers for a saved view"""
     try:
@@ -523,17 +528,7 @@ def get_map_view(view_name: str, user_id: int = Query(...)):
             return {"error": "View name must be one of: View 1, View 2, View 3, View 4, View 5"}, 400
             
         # Fetch saved view from DB
-        conn = sqlite3.connect("user_views.db")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT selected_columns FROM saved_views 
-            WHERE user_id = ? AND view_name = ?
-        """, (user_id, view_name))
-        
-        view = cursor.fetchone()
-        conn.close()
+        view = views_db.get_saved_view(user_id, view_name)
         
         if not view:
             return {"markers": []}
@@ -549,82 +544,15 @@ def get_map_view(view_name: str, user_id: int = Query(...)):
         validated_columns = [col for col in selected_columns if col in allowed_columns]
         
         # Check if location-related columns are included
-        # Common location column names in the dataset
-        location_columns = [
-            "Spatial Coordinates", 
-            "Latitude", 
-            "Longitude", 
-            "lat", 
-            "lng", 
-            "location"
-        ]
-        
-        has_location = any(col in validated_columns for col in location_columns)
+        has_location = any(col in validated_columns for col in LOCATION_COLUMNS)
         
         if not has_location:
             # If no location column is selected, return empty markers
             return {"markers": []}
             
-        # Read the CSV file
-        df = pd.read_csv(os.path.join(DATA_DIR, "transformed_transformer_data.csv"))
-        
-        # Filter DataFrame to only include selected columns
-        filtered_df = df[validated_columns]
-        
-        # Handle NaN and infinite values to make them JSON compliant
-        # Replace infinite values with None
-        filtered_df = filtered_df.replace([float('inf'), float('-inf')], None)
-        
-        # Replace NaN values with None
-        filtered_df = filtered_df.where(pd.notna(filtered_df), None)
-        
-        # Convert DataFrame to list of dictionaries
-        filtered_data = filtered_df.to_dict('records')
-        
-        # Process data to extract map markers
-        markers = []
-        for row in filtered_data:
-            # Look for location data in the row
-            spatial_coords = None
-            
-            # Check for spatial coordinates column first
-            if "Spatial Coordinates" in row and row["Spatial Coordinates"]:
-                spatial_coords = row["Spatial Coordinates"]
-            # Check for other possible location columns
-            elif "Latitude" in row and "Longitude" in row and row["Latitude"] is not None and row["Longitude"] is not None:
-                spatial_coords = f"{row['Latitude']}, {row['Longitude']}"
-            
-            # If we have location data, create a marker
-            if spatial_coords:
-                try:
-                    # Parse coordinates (format: "lat, lng")
-                    coords = spatial_coords.strip('"').split(', ')
-                    if len(coords) == 2:
-                        lat = float(coords[0])
-                        lng = float(coords[1])
-                        
-                        # Skip invalid coordinates
-                        if pd.isna(lat) or pd.isna(lng):
-                            continue
-                        
-                        # Get site name if available
-                        site_name = row.get('Site Name', 'Unknown Site')
-                        if pd.isna(site_name):
-                            site_name = 'Unknown Site'
-                        
-                        # Create marker with location and info
-                        marker = {
-                            "position": [lat, lng],
-                            "site_name": site_name,
-                            "info": {col: row[col] for col in validated_columns if col != "Spatial Coordinates"}
-                        }
-                        
-                        markers.append(marker)
-                except (ValueError, IndexError):
-                    # Skip rows with invalid coordinates
-                    continue
-        
-        return {"markers": markers}
+        # The encoded markers are materialized per view definition and dataset version
+        payload = view_map_payload(get_snapshot(), user_id, view_name, selected_columns_str, validated_columns)
+        return Response(content=payload, media_type="application/json")
         
     except Exception as e:
         # Log the full error for debugging
@@ -634,8 +562,143 @@ def get_map_view(view_name: str, user_id: int = Query(...)):
         print(f"Error details: {error_details}")
         return {"error": f"Failed to load map view data: {str(e)}"}, 500
 
+# Not memoized: the encoded responses are cached in the bounded view_cache LRU
+def build_view_data(snapshot, validated_columns):
+    """JSON-compliant records of the selected columns"""
+    return clean_records(snapshot.df[validated_columns])
+
+def build_view_markers(snapshot, validated_columns):
+    """Map markers for a saved view's columns"""
+    filtered_data = build_view_data(snapshot, validated_columns)
+    
+    # Process data to extract map markers
+    markers = []
+    for row in filtered_data:
+        # Look for location data in the row
+        spatial_coords = None
+        
+        # Check for spatial coordinates column first
+        if "Spatial Coordinates" in row and row["Spatial Coordinates"]:
+            spatial_coords = row["Spatial Coordinates"]
+        # Check for other possible location columns
+        elif "Latitude" in row and "Longitude" in row and row["Latitude"] is not None and row["Longitude"] is not None:
+            spatial_coords = f"{row['Latitude']}, {row['Longitude']}"
+        
+        # If we have location data, create a marker
+        if spatial_coords:
+            try:
+                # Parse coordinates (format: "lat, lng")
+                coords = spatial_coords.strip('"').split(', ')
+                if len(coords) == 2:
+                    lat = float(coords[0])
+                    lng = float(coords[1])
+                    
+                    # Skip invalid coordinates
+                    if pd.isna(lat) or pd.isna(lng):
+                        continue
+                    
+                    # Get site name if available
+                    site_name = row.get('Site Name', 'Unknown Site')
+                    if pd.isna(site_name):
+                        site_name = 'Unknown Site'
+                    
+                    # Create marker with location and info
+                    marker = {
+                        "position": [lat, lng],
+                        "site_name": site_name,
+                        "info": {col: row[col] for col in validated_columns if col != "Spatial Coordinates"}
+                    }
+                    
+                    markers.append(marker)
+            except (ValueError, IndexError):
+                # Skip rows with invalid coordinates
+                continue
+    
+    return markers
+
+# Common location column names in the dataset
+LOCATION_COLUMNS = ["Spatial Coordinates", "Latitude", "Longitude", "lat", "lng", "location"]
+
+def view_data_payload(snapshot, user_id, view_name, selected_columns_str, validated_columns):
+    """Encoded /api/views/{view_name}/data response, cached in view_cache"""
+    def build():
+        return encode_json({
+            "view_name": view_name,
+            "user_id": user_id,
+            "selected_columns": validated_columns,
+            "data": build_view_data(snapshot, validated_columns)
+        })
+    return view_cache.get_or_build(user_id, view_name, selected_columns_str, snapshot.version, "data", build)
+
+def view_map_payload(snapshot, user_id, view_name, selected_columns_str, validated_columns):
+    """Encoded /api/views/{view_name}/map response, cached in view_cache"""
+    def build():
+        return encode_json({"markers": build_view_markers(snapshot, validated_columns)})
+    return view_cache.get_or_build(user_id, view_name, selected_columns_str, snapshot.version, "map", build)
+
+def warm_saved_views(snapshot):
+    """Materialize the data and map responses of every saved view for a snapshot"""
+    view_cache.retain_version(snapshot.version)
+    allowed_columns = set(snapshot.df.columns)
+    warmed = 0
+    for view in views_db.all_saved_views():
+        selected_columns_str = view["selected_columns"]
+        selected_columns = selected_columns_str.split(",") if selected_columns_str else []
+        validated_columns = [col for col in selected_columns if col in allowed_columns]
+        if validated_columns:
+            args = (snapshot, view["user_id"], view["view_name"], selected_columns_str, validated_columns)
+            view_data_payload(*args)
+            if any(col in validated_columns for col in LOCATION_COLUMNS):
+                view_map_payload(*args)
+            warmed += 1
+    return warmed
+
+# Predictive materialization of a user's saved views, triggered by listing them
+VIEW_PREFETCH_BUDGET_MS = float(os.getenv("VIEW_PREFETCH_BUDGET_MS", 500))
+VIEW_PREFETCH_MAX_VIEWS = int(os.getenv("VIEW_PREFETCH_MAX_VIEWS", 5))
+_prefetch_pending = set()
+_prefetch_lock = threading.Lock()
+
+def schedule_view_prefetch(user_id):
+    """Queue background materialization of a user's saved views (one pending job per user)"""
+    if not warmup_state["ready"]:
+        # The startup warm-up covers every saved view anyway
+        return False
+    with _prefetch_lock:
+        if user_id in _prefetch_pending:
+            return False
+        _prefetch_pending.add(user_id)
+    cpu_pool.background.submit(prefetch_user_views, user_id)
+    return True
+
+def prefetch_user_views(user_id):
+    """Materialize a user's saved views against the current version, within the prefetch budget"""
+    try:
+        snapshot = get_snapshot()
+        allowed_columns = get_allowed_columns()
+        deadline = time.perf_counter() + VIEW_PREFETCH_BUDGET_MS / 1000
+        for view in views_db.list_saved_views(user_id)[:VIEW_PREFETCH_MAX_VIEWS]:
+            if time.perf_counter() > deadline:
+                break
+            selected_columns_str = view["selected_columns"]
+            selected_columns = selected_columns_str.split(",") if selected_columns_str else []
+            validated_columns = [col for col in selected_columns if col in allowed_columns]
+            if not validated_columns:
+                continue
+            args = (snapshot, user_id, view["view_name"], selected_columns_str, validated_columns)
+            view_data_payload(*args)
+            if any(col in validated_columns for col in LOCATION_COLUMNS):
+                view_map_payload(*args)
+    except Exception as e:
+        print(f"Saved-view prefetch for user {user_id} failed: {str(e)}")
+    finally:
+        with _prefetch_lock:
+            _prefetch_pending.discard(user_id)
+
 # New endpoint to get filtered map data with additional filters
 @app.post("/api/views/{view_name}/map-data")
+@admission.limit("filtered_map_data")
+@cpu_bound
 def get_filtered_map_data(view_name: str, request_data: dict = Body(default={})):
     """Get map markers for a saved view with additional filters applied"""
     print("=== DEBUG: get_filtered_map_data called ===")
@@ -658,9 +721,10 @@ def get_filtered_map_data(view_name: str, request_data: dict = Body(default={}))
             print(f"Invalid view name: {view_name}")
             return {"error": "View name must be one of: View 1, View 2, View 3, View 4, View 5"}, 400
             
-        # Read the CSV file
-        df = pd.read_csv(os.path.join(DATA_DIR, "transformed_transformer_data.csv"))
-        print(f"Loaded CSV with {len(df)} rows")
+        # Filters only select rows of the shared dataset; numeric filters copy
+        # the rows they keep (see below), the snapshot itself is never modified
+        df = get_snapshot().df
+        print(f"Loaded dataset with {len(df)} rows")
         
         # Apply filters if provided
         if filters:
@@ -692,21 +756,25 @@ def get_filtered_map_data(view_name: str, request_data: dict = Body(default={}))
                                 elif operator == "!=":
                                     df = df[df[csv_column] != value]
                                 elif operator == ">":
-                                    # Convert to numeric for comparison
-                                    df[csv_column] = pd.to_numeric(df[csv_column], errors='coerce')
-                                    df = df[df[csv_column] > float(value)]
+                                    # Convert to numeric for comparison; the kept rows carry the converted column
+                                    numeric = pd.to_numeric(df[csv_column], errors='coerce')
+                                    keep = numeric > float(value)
+                                    df = df[keep].assign(**{csv_column: numeric[keep]})
                                 elif operator == "<":
-                                    # Convert to numeric for comparison
-                                    df[csv_column] = pd.to_numeric(df[csv_column], errors='coerce')
-                                    df = df[df[csv_column] < float(value)]
+                                    # Convert to numeric for comparison; the kept rows carry the converted column
+                                    numeric = pd.to_numeric(df[csv_column], errors='coerce')
+                                    keep = numeric < float(value)
+                                    df = df[keep].assign(**{csv_column: numeric[keep]})
                                 elif operator == ">=":
-                                    # Convert to numeric for comparison
-                                    df[csv_column] = pd.to_numeric(df[csv_column], errors='coerce')
-                                    df = df[df[csv_column] >= float(value)]
+                                    # Convert to numeric for comparison; the kept rows carry the converted column
+                                    numeric = pd.to_numeric(df[csv_column], errors='coerce')
+                                    keep = numeric >= float(value)
+                                    df = df[keep].assign(**{csv_column: numeric[keep]})
                                 elif operator == "<=":
-                                    # Convert to numeric for comparison
-                                    df[csv_column] = pd.to_numeric(df[csv_column], errors='coerce')
-                                    df = df[df[csv_column] <= float(value)]
+                                    # Convert to numeric for comparison; the kept rows carry the converted column
+                                    numeric = pd.to_numeric(df[csv_column], errors='coerce')
+                                    keep = numeric <= float(value)
+                                    df = df[keep].assign(**{csv_column: numeric[keep]})
                                 elif operator == "contains":
                                     df = df[df[csv_column].astype(str).str.contains(str(value), case=False, na=False)]
                                 elif operator == "in":
@@ -793,6 +861,8 @@ def get_filtered_map_data(view_name: str, request_data: dict = Body(default={}))
         return {"error": f"Failed to load filtered map data: {str(e)}"}, 500
 
 @app.post("/api/map-data")
+@admission.limit("homepage_map_data")
+@cpu_bound
 def get_homepage_map_data(request_data: dict = Body(default={})):
     """Get map markers for the home page with filters applied"""
     print("=== DEBUG: get_homepage_map_data called ===")
@@ -803,9 +873,10 @@ def get_homepage_map_data(request_data: dict = Body(default={})):
         filters = request_data.get("filters", {})
         print(f"Applying filters: {filters}")
         
-        # Read the CSV file
-        df = pd.read_csv(os.path.join(DATA_DIR, "transformed_transformer_data.csv"))
-        print(f"Loaded CSV with {len(df)} rows")
+        # Filters below only select rows, so the shared snapshot is used without copying
+        snapshot = get_snapshot()
+        df = snapshot.df
+        print(f"Loaded dataset with {len(df)} rows")
         
         # Build SQL-like query dynamically with WHERE clauses
         # In this case, we're using pandas filtering which is equivalent
@@ -825,9 +896,13 @@ def get_homepage_map_data(request_data: dict = Body(default={})):
         # Apply Available Power filter (>= equivalent)
         if "available_power" in filters and filters["available_power"] is not None:
             power_filter = float(filters["available_power"])
-            # Convert to numeric for comparison
-            df["Generation Headroom Mw"] = pd.to_numeric(df["Generation Headroom Mw"], errors='coerce')
-            df = df[df["Generation Headroom Mw"] >= power_filter]
+            if pd.api.types.is_numeric_dtype(df["Generation Headroom Mw"]):
+                # Range lookup through the sort permutation published with the dataset
+                at_least = snapshot.rows_at_least("Generation Headroom Mw", power_filter)
+                df = df[at_least[df.index]]
+            else:
+                # Convert to numeric for comparison
+                df = df[pd.to_numeric(df["Generation Headroom Mw"], errors='coerce') >= power_filter]
             print(f"Applied available power filter: >= {power_filter}, rows now: {len(df)}")
         
         # Apply Network Operator filter (= equivalent)
@@ -886,11 +961,10 @@ def get_homepage_map_data(request_data: dict = Body(default={})):
         return {"error": f"Failed to load filtered map data: {str(e)}"}, 500
 
 def get_allowed_columns():
-    """Get list of allowed columns to prevent SQL injection"""
+    """Get the allowed columns (supports O(1) membership checks) to prevent SQL injection"""
     try:
-        # Read the CSV file to get actual column names
-        df = pd.read_csv(os.path.join(DATA_DIR, "transformed_transformer_data.csv"))
-        return list(df.columns)
+        # Schema registry of the published version; no row data is read
+        return get_schema()
     except Exception:
         # Fallback to a predefined list if CSV reading fails
         return [
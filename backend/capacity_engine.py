@@ -0,0 +1,354 @@
+"""
+Columnar transformer-capacity engine for grid_and_primary_calculated.py.
+
+Replaces the row-wise df.apply(process_row, axis=1). The transformer ratings
+are parsed once per column into padded 2-D arrays with a validity mask,
+Spare/Firm capacity become array expressions and the TransN_Summer /
+TransN_Winter columns are added in a single concat.
+
+The output is bit-identical to the row-wise version, so the few places
+where Python scalar semantics differ from NumPy's are reproduced explicitly:
+round() (correctly rounded, unlike np.round), sum() (left to right from int 0,
+compensated on Python 3.12+), max()/min() with NaN (first operand wins unless
+the comparison is true) and slicing by a negative transformer count.
+"""
+
+import re
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+SEASONS = [("Summer", "transratingsummer", "maxdemandsummer"), ("Winter", "transratingwinter", "maxdemandwinter")]
+
+# reversepower kinds, see classify_reversepower
+REVERSEPOWER_UNKNOWN = 0   # blank or unparseable: no generation capacity
+REVERSEPOWER_FULL = 1      # "100%": first transformer rating
+REVERSEPOWER_HALF = 2      # "<100%": first transformer rating / 2
+REVERSEPOWER_MVA = 3       # "X MVA[, Y MVA ...]": the smallest MVA value
+REVERSEPOWER_PERCENT = 4   # other "X%": first transformer rating * X / 100
+
+MVA_PATTERN = r'([\d.]+)\s*mva'
+PERCENT_PATTERN = r'([\d.]+)\s*%'
+
+# A plain decimal number as the old isdigit() checks accepted it: optional
+# leading minus, digits with at most one decimal point
+NUMBER_PATTERN = re.compile(r'-?(?:\d+\.?\d*|\.\d+)')
+
+# values: ratings with the valid ones moved to the front (NaN padded)
+# lengths: number of ratings kept after truncating at powertransformercount
+# raw_values / raw_valid: ratings at their original token positions
+ParsedRatings = namedtuple("ParsedRatings", ["values", "lengths", "raw_values", "raw_valid"])
+
+
+def safe_numeric_convert(value_str):
+    """Convert string values to numeric, return None for invalid/empty values"""
+    if pd.isna(value_str) or str(value_str).strip() == '' or str(value_str).strip().lower() == 'null':
+        return None
+    try:
+        return float(str(value_str).strip())
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_number(value_str):
+    """Convert a plain decimal number, return None for anything else"""
+    return float(value_str) if NUMBER_PATTERN.fullmatch(value_str) else None
+
+
+def split_tokens(series):
+    """
+    Split a column of comma-separated lists into a padded object matrix
+    (one row per value, None where a row has fewer tokens). Missing values
+    produce no tokens; other values are split on their str() form.
+    """
+    values = series.to_numpy(dtype=object)
+    present = ~pd.isna(values)
+    if not present.any():
+        return np.empty((len(values), 0), dtype=object)
+    split = pd.Series(values[present], dtype=object).map(str).str.split(",", expand=True)
+    tokens = np.full((len(values), split.shape[1]), None, dtype=object)
+    tokens[present] = split.to_numpy(dtype=object)
+    tokens[pd.isna(tokens)] = None
+    return tokens
+
+
+def convert_tokens(tokens, converter):
+    """
+    Apply a scalar converter (returning a float or None) to every distinct
+    token once. Returns (values, valid): float matrix (NaN where invalid) and
+    the mask of tokens the converter accepted. A converted NaN is valid.
+    """
+    exists = tokens != None  # noqa: E711 - elementwise comparison on an object array
+    lookup = {token: converter(token.strip()) for token in pd.unique(tokens[exists])}
+    values = np.full(tokens.shape, np.nan)
+    valid = np.zeros(tokens.shape, dtype=bool)
+    if lookup:
+        present = pd.Series(tokens[exists], dtype=object)
+        valid[exists] = present.map({token: value is not None for token, value in lookup.items()}).to_numpy(dtype=bool)
+        values[exists] = present.map({token: np.nan if value is None else value for token, value in lookup.items()}).to_numpy(dtype=float)
+    return values, valid
+
+
+def compact(values, valid):
+    """Move each row's valid entries to the front, in order (NaN behind them)"""
+    # Stable sort on the inverted mask keeps the valid entries' order
+    order = np.argsort(~valid, axis=1, kind="stable")
+    return np.take_along_axis(values, order, axis=1), valid.sum(axis=1)
+
+
+def sum_numeric_lists(series):
+    """
+    Parse a column of numbers or comma-separated number lists and return the
+    row totals as floats. Blank or malformed values count as 0; in a list the
+    malformed entries are skipped.
+    """
+    tokens = split_tokens(series)
+    if tokens.shape[1] == 0:
+        return np.zeros(len(series))
+    values, valid = convert_tokens(tokens, parse_number)
+    is_list = (tokens != None).sum(axis=1) > 1  # noqa: E711
+    single = np.where(valid[:, 0], values[:, 0], 0.0)
+    listed, lengths = compact(values, valid)
+    return np.where(is_list, python_sum(listed, lengths), single)
+
+
+def transformer_counts(series):
+    """powertransformercount as Python int() sees it (raises on missing values, like process_row)"""
+    return np.array([int(value) for value in series.to_numpy(dtype=object)], dtype=np.int64)
+
+
+def parse_ratings(series, counts):
+    """Parse a transrating column and truncate each row's valid ratings at its transformer count"""
+    raw_values, raw_valid = convert_tokens(split_tokens(series), safe_numeric_convert)
+    values, n_valid = compact(raw_values, raw_valid)
+    # Python slice semantics of valid[:count], including negative counts
+    lengths = np.where(counts >= 0, np.minimum(counts, n_valid), np.maximum(n_valid + counts, 0))
+    return ParsedRatings(values, lengths, raw_values, raw_valid)
+
+
+def python_sum(values, lengths):
+    """Row sums of values[:, :length] with the semantics of Python's built-in sum()"""
+    n, width = values.shape
+    if width == 0:
+        return np.zeros(n)
+    active = lengths > 0
+    # sum() starts from int 0: 0 + x0 turns -0.0 into 0.0
+    total = np.where(active, 0.0 + values[:, 0], 0.0)
+    compensation = np.zeros(n)
+    for j in range(1, width):
+        active = j < lengths
+        x = values[:, j]
+        t = total + x
+        if sys.version_info >= (3, 12):
+            # Python 3.12+ sums floats with Neumaier compensation
+            step = np.where(np.abs(total) >= np.abs(x), (total - t) + x, (x - t) + total)
+            compensation = np.where(active, compensation + step, compensation)
+        total = np.where(active, t, total)
+    if sys.version_info >= (3, 12):
+        apply = (compensation != 0) & np.isfinite(compensation)
+        total = np.where(apply, total + compensation, total)
+    return total
+
+
+def python_max(values, lengths, default=0.0):
+    """Row maxima of values[:, :length] with the semantics of Python's max(..., default=...)"""
+    n, width = values.shape
+    if width == 0:
+        return np.full(n, default)
+    result = np.where(lengths > 0, values[:, 0], default)
+    for j in range(1, width):
+        candidate = values[:, j]
+        result = np.where((j < lengths) & (candidate > result), candidate, result)
+    return result
+
+
+def python_min(a, b):
+    """Elementwise Python min(a, b): b only when it compares strictly smaller"""
+    return np.where(b < a, b, a)
+
+
+def python_round(values, ndigits):
+    """Elementwise Python round(x, ndigits), which is correctly rounded unlike np.round"""
+    return np.array([round(value, ndigits) for value in values.tolist()], dtype=float)
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def classify_reversepower(series):
+    """
+    Classify every reversepower value once into (kind, parameter) arrays: the
+    parameter is the minimum MVA for REVERSEPOWER_MVA and the percentage for
+    REVERSEPOWER_PERCENT. Values whose number does not parse are UNKNOWN.
+    """
+    n = len(series)
+    kinds = np.full(n, REVERSEPOWER_UNKNOWN, dtype=np.int8)
+    params = np.full(n, np.nan)
+    values = series.to_numpy(dtype=object)
+    present = ~pd.isna(values) & (values != '')
+    if not present.any():
+        return kinds, params
+
+    text = pd.Series(values[present], dtype=object).map(str).str.strip().str.lower()
+    position = np.flatnonzero(present)
+    has_percent = text.str.contains('%', regex=False).to_numpy(dtype=bool)
+    undecided = np.ones(len(text), dtype=bool)
+
+    full = (text == '100%').to_numpy(dtype=bool)
+    kinds[position[full]] = REVERSEPOWER_FULL
+    undecided &= ~full
+
+    half = undecided & text.str.contains('<', regex=False).to_numpy(dtype=bool) & has_percent
+    kinds[position[half]] = REVERSEPOWER_HALF
+    undecided &= ~half
+
+    # MVA lists: every match must parse, the smallest wins
+    mva_rows = undecided & text.str.contains('mva', regex=False).to_numpy(dtype=bool)
+    if mva_rows.any():
+        matches = text[mva_rows].str.extractall(MVA_PATTERN)[0]
+        if len(matches):
+            parsed = matches.map({token: _to_float(token) for token in matches.unique()})
+            row = matches.index.get_level_values(0)
+            failed = parsed.isna().groupby(row).any()
+            smallest = parsed.groupby(row).min()
+            matched = np.zeros(len(text), dtype=bool)
+            matched[smallest.index] = True
+            ok = np.zeros(len(text), dtype=bool)
+            ok[failed.index[~failed.to_numpy()]] = True
+            kinds[position[ok]] = REVERSEPOWER_MVA
+            params[position[ok]] = smallest[ok[smallest.index]].to_numpy(dtype=float)
+            undecided &= ~matched
+
+    # Remaining percentages: the first "X%" in the text
+    percent_rows = undecided & has_percent
+    if percent_rows.any():
+        first_match = text[percent_rows].str.extract(PERCENT_PATTERN, expand=False).dropna()
+        percent = first_match.map({token: _to_float(token) for token in first_match.unique()})
+        percent = percent[percent.notna()]
+        kinds[position[percent.index]] = REVERSEPOWER_PERCENT
+        params[position[percent.index]] = percent.to_numpy(dtype=float)
+
+    return kinds, params
+
+
+def generation_capacity(kinds, params, first):
+    """Generation capacity per row from the reversepower classification and the first kept rating"""
+    return np.select(
+        [kinds == REVERSEPOWER_FULL, kinds == REVERSEPOWER_HALF, kinds == REVERSEPOWER_MVA, kinds == REVERSEPOWER_PERCENT],
+        [first, first / 2, params, first * (params / 100)],
+        default=0.0,
+    )
+
+
+def first_rating(ratings):
+    """First kept rating per row, 0.0 when none are kept"""
+    if ratings.values.shape[1] == 0:
+        return np.zeros(len(ratings.lengths))
+    return np.where(ratings.lengths > 0, ratings.values[:, 0], 0.0)
+
+
+def trans_column(ratings, counts, position):
+    """Values of TransN for rating `position` (0-based): the raw token when valid and within the count"""
+    n = len(counts)
+    if position < ratings.raw_values.shape[1]:
+        keep = (counts > position) & ratings.raw_valid[:, position]
+        values = np.where(keep, ratings.raw_values[:, position], np.nan)
+    else:
+        keep = np.zeros(n, dtype=bool)
+        values = np.full(n, np.nan)
+    if not keep.any() and (counts > position).all():
+        # Every row wrote None into this column, which stays an all-None object column
+        return np.full(n, None, dtype=object)
+    return values
+
+
+def tracked_trans_columns(counts):
+    """TransN column names in the order process_row registered them (first appearance)"""
+    ordered = []
+    seen = set()
+    for count in pd.unique(counts):
+        for season, _, _ in SEASONS:
+            for i in range(count):
+                name = f'Trans{i+1}_{season}'
+                if name not in seen:
+                    seen.add(name)
+                    ordered.append((name, season, i + 1))
+    return ordered
+
+
+def transformer_capacity(df, spare_multiplier):
+    """
+    Columnar equivalent of df.apply(process_row, axis=1).
+
+    Returns (df_processed, trans_columns) where trans_columns lists
+    (name, season, position) in registration order.
+    """
+    if len(df) == 0:
+        return df.copy(), []
+
+    counts = transformer_counts(df["powertransformercount"])
+    if "reversepower" in df.columns:
+        kinds, params = classify_reversepower(df["reversepower"])
+    else:
+        kinds, params = np.full(len(df), REVERSEPOWER_UNKNOWN, dtype=np.int8), np.full(len(df), np.nan)
+
+    new_columns = {}
+    lengths = {}
+    spare = {}
+    firm = {}
+    generation = {}
+    trans = {}
+    # Python float arithmetic propagates NaN/inf silently; so should the arrays
+    with np.errstate(invalid="ignore", over="ignore"):
+        for season, rating_col, demand_col in SEASONS:
+            ratings = parse_ratings(df[rating_col], counts)
+            if demand_col in df.columns:
+                demand = sum_numeric_lists(df[demand_col])
+            else:
+                demand = np.zeros(len(df))
+
+            total = python_sum(ratings.values, ratings.lengths)
+            largest = python_max(ratings.values, ratings.lengths)
+            first = first_rating(ratings)
+            single = ratings.lengths == 1
+
+            spare[season] = python_round(np.where(
+                single,
+                (first - demand) * spare_multiplier,
+                ((total - largest) - demand) * spare_multiplier,
+            ), 2)
+            firm[season] = np.where(single, first * spare_multiplier, (total - largest) * spare_multiplier)
+            generation[season] = generation_capacity(kinds, params, first)
+            trans[season] = [trans_column(ratings, counts, i) for i in range(max(counts.max(), 0))]
+            lengths[season] = ratings.lengths
+
+        for season, _, _ in SEASONS:
+            for i, values in enumerate(trans[season]):
+                new_columns[f'Trans{i+1}_{season}'] = values
+            new_columns[f'Spare_{season}'] = spare[season]
+        new_columns['Generation_Capacity'] = python_min(generation["Summer"], generation["Winter"])
+        both_rated = (lengths["Summer"] > 0) & (lengths["Winter"] > 0)
+        new_columns['Firm_Capacity'] = np.where(
+            both_rated, python_round(python_min(firm["Summer"], firm["Winter"]), 2), 0.0
+        )
+
+    # The row-wise version round-tripped every row through an object Series
+    base = pd.DataFrame(df.to_numpy(), index=df.index, columns=df.columns).infer_objects()
+    result = pd.concat([base, pd.DataFrame(new_columns, index=df.index)], axis=1)
+
+    # Rows with different transformer counts produced differently shaped rows, which
+    # DataFrame.apply combined under the sorted union of their labels
+    row_width = np.maximum(counts, 0)
+    if (row_width != row_width[0]).any():
+        try:
+            result = result[sorted(result.columns)]
+        except TypeError:
+            pass
+
+    return result, tracked_trans_columns(counts)
@@ -0,0 +1,149 @@
+"""
+Memory-mapped column store for published dataset versions.
+
+Each dataset version is written once to DATASET_STORE_DIR/<version>/ as plain
+.npy files plus a manifest. Every uvicorn/gunicorn worker attaches the files
+read-only with np.load(mmap_mode="r"), so the OS page cache holds one copy of
+the data however many workers are running.
+
+Layout of a version directory:
+  manifest.json     column order, kinds, dtypes, categories, derived arrays
+  col_<n>.npy       values of numeric column n
+  codes_<n>.npy     categorical codes of text column n (categories in manifest)
+  <name>.npy        derived arrays (coordinates, sort permutations, ...)
+
+Set DATASET_STORE_DIR to a tmpfs path such as /dev/shm/geniusdb to keep the
+store in shared memory instead of on disk.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+STORE_DIR = os.getenv("DATASET_STORE_DIR", os.path.join(DATA_DIR, "versions"))
+KEEP_VERSIONS = 3
+MANIFEST = "manifest.json"
+
+
+def _version_dir(version):
+    return os.path.join(STORE_DIR, version)
+
+
+@contextmanager
+def publish_lock():
+    """Cross-process lock so only one worker builds a given version"""
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with open(os.path.join(STORE_DIR, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _json_value(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def publish(version, df, derived_arrays, schema=None):
+    """Write `df`, its derived arrays and (optionally) its schema as the column store for `version`"""
+    final_dir = _version_dir(version)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for n, col in enumerate(df.columns):
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            np.save(os.path.join(tmp_dir, f"col_{n}.npy"), series.to_numpy())
+            columns.append({"name": col, "kind": "numeric", "dtype": str(series.dtype)})
+        else:
+            # Text columns are dictionary-encoded: small int codes shared via mmap,
+            # only the distinct values are materialized per worker
+            codes, uniques = pd.factorize(series)
+            categorical = pd.Categorical.from_codes(codes, categories=uniques)
+            np.save(os.path.join(tmp_dir, f"codes_{n}.npy"), categorical.codes)
+            columns.append({
+                "name": col,
+                "kind": "categorical",
+                "categories": [_json_value(value) for value in categorical.categories],
+            })
+
+    for name, values in derived_arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(values))
+
+    manifest = {
+        "version": version,
+        "rows": len(df),
+        "columns": columns,
+        "arrays": sorted(derived_arrays),
+    }
+    if schema is not None:
+        manifest["schema"] = schema
+    with open(os.path.join(tmp_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, default=str)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.rename(tmp_dir, final_dir)
+    _prune_old_versions(keep=version)
+
+
+def read_manifest(version):
+    """Manifest of a published version, or None"""
+    manifest_path = os.path.join(_version_dir(version), MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def attach(version):
+    """
+    Attach a published version read-only. Returns (df, arrays, manifest), or
+    None if the version has not been published yet.
+    """
+    version_dir = _version_dir(version)
+    manifest = read_manifest(version)
+    if manifest is None:
+        return None
+
+    parts = []
+    for n, column in enumerate(manifest["columns"]):
+        name = column["name"]
+        if column["kind"] == "numeric":
+            values = np.load(os.path.join(version_dir, f"col_{n}.npy"), mmap_mode="r")
+            # A 2-D view becomes a single block without copying the mapped pages
+            parts.append(pd.DataFrame(values[:, np.newaxis], columns=[name], copy=False))
+        else:
+            codes = np.load(os.path.join(version_dir, f"codes_{n}.npy"), mmap_mode="r")
+            categorical = pd.Categorical.from_codes(codes, categories=column["categories"])
+            parts.append(pd.DataFrame({name: categorical}, copy=False))
+
+    if parts:
+        df = pd.concat(parts, axis=1, copy=False)
+    else:
+        df = pd.DataFrame(index=pd.RangeIndex(manifest["rows"]))
+
+    arrays = {
+        name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r")
+        for name in manifest["arrays"]
+    }
+    return df, arrays, manifest
+
+
+def _prune_old_versions(keep):
+    """Remove all but the newest KEEP_VERSIONS versions (open mappings stay valid)"""
+    entries = []
+    for entry in os.listdir(STORE_DIR):
+        path = os.path.join(STORE_DIR, entry)
+        if entry != keep and os.path.isdir(path) and not entry.endswith(".tmp"):
+            entries.append((os.path.getmtime(path), path))
+    for _, path in sorted(entries, reverse=True)[KEEP_VERSIONS - 1:]:
+        shutil.rmtree(path, ignore_errors=True)
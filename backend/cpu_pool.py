@@ -0,0 +1,42 @@
+"""
+Dedicated executor for CPU-heavy request handlers.
+
+Sync FastAPI handlers all share Starlette's default thread pool, so a burst of
+full-table filter/serialize requests could occupy every thread and leave cheap
+requests (/health, metadata, view listing) queued behind them. Handlers marked
+with @cpu_bound run on this separate, bounded pool instead.
+
+Configured through CPU_POOL_WORKERS (default: number of CPUs, at most 4).
+
+Speculative background work (e.g. prefetching saved views) goes to a
+separate single-thread executor so it never takes request capacity.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+
+_executor = ThreadPoolExecutor(max_workers=CPU_POOL_WORKERS, thread_name_prefix="cpu")
+background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background")
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Run `func` on the CPU pool without blocking the event loop"""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def cpu_bound(func):
+    """Turn a sync handler into an async one that executes on the CPU pool"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_cpu(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown():
+    _executor.shutdown(wait=False)
+    background.shutdown(wait=False)
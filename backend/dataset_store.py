@@ -0,0 +1,309 @@
+"""
+Versioned in-process cache of the transformed transformer dataset.
+
+The API used to re-read transformed_transformer_data.csv on every request.
+This module loads it once per dataset version and keeps the derived
+artifacts (parsed coordinates, facet counts, GeoJSON, the encoded full-table
+payload, ...) next to it, so they are built once and shared by every request
+until a new version is published.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import column_store
+import schema_registry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+DATASET_FILE = "transformed_transformer_data.csv"
+DATASET_PATH = os.path.join(DATA_DIR, DATASET_FILE)
+
+# grid_and_primary_calculated.py writes its output into its working directory
+PIPELINE_OUTPUT_PATH = os.path.join(BASE_DIR, DATASET_FILE)
+
+# Columns the home page / map filters facet on
+FACET_COLUMNS = ["Site Voltage", "Licence Area", "Site Type", "County", "Bulk Supply Point"]
+
+# Registered artifact builders: {name: builder(snapshot)}
+ARTIFACT_BUILDERS = {}
+
+
+def artifact(name):
+    """Register a builder for a derived artifact of a dataset snapshot"""
+    def decorator(builder):
+        ARTIFACT_BUILDERS[name] = builder
+        return builder
+    return decorator
+
+
+def dataset_version(path=DATASET_PATH):
+    """Cheap fingerprint of the published dataset file (no row data is read)"""
+    stat = os.stat(path)
+    raw = f"{stat.st_mtime_ns}:{stat.st_size}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class DatasetSnapshot:
+    """One immutable version of the dataset plus its lazily built artifacts"""
+
+    def __init__(self, version, df, arrays=None):
+        self.version = version
+        self.df = df
+        # Derived arrays published with the version (memory-mapped, shared by all workers)
+        self.arrays = arrays or {}
+        self.loaded_at = time.time()
+        self._artifacts = {}
+        self._lock = threading.RLock()
+
+    def artifact(self, name):
+        """Return a derived artifact, building it on first use"""
+        if name in self._artifacts:
+            return self._artifacts[name]
+        with self._lock:
+            if name not in self._artifacts:
+                self._artifacts[name] = ARTIFACT_BUILDERS[name](self)
+            return self._artifacts[name]
+
+    def sort_permutation(self, column):
+        """Stable ascending row order of a numeric column (NaN last), or None"""
+        position = self.df.columns.get_loc(column)
+        return self.arrays.get(f"sort_{position}")
+
+    def rows_at_least(self, column, threshold):
+        """Boolean row mask of `column >= threshold` via the published sort permutation"""
+        values = self.df[column].to_numpy()
+        order = self.sort_permutation(column)
+        if order is None:
+            return values >= threshold
+        start = np.searchsorted(values, threshold, side="left", sorter=order)
+        # NaN sorts last and never satisfies the comparison
+        end = np.searchsorted(values, np.nan, side="left", sorter=order)
+        mask = np.zeros(len(values), dtype=bool)
+        mask[order[start:end]] = True
+        return mask
+
+    def warm(self):
+        """Build every registered artifact and return per-artifact build times (ms)"""
+        timings = {}
+        for name in ARTIFACT_BUILDERS:
+            start = time.perf_counter()
+            self.artifact(name)
+            timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        return timings
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def parse_coordinates(series):
+    """Parse "lat, lng" strings into two float arrays (NaN where unparseable)"""
+    raw = series.where(series != "\\N")
+    parts = raw.astype(str).str.strip().str.strip('"').str.split(", ")
+    two_parts = parts.str.len() == 2
+    # float() rather than pd.to_numeric: it round-trips the stored digits exactly
+    lat = parts.str[0].where(two_parts).map(_to_float).astype(float)
+    lng = parts.str[1].where(two_parts).map(_to_float).astype(float)
+    return lat.to_numpy(), lng.to_numpy()
+
+
+def derived_arrays(df):
+    """Arrays published alongside a dataset version: coordinates and sort permutations"""
+    arrays = {}
+    if "Spatial Coordinates" in df.columns:
+        arrays["coords_lat"], arrays["coords_lng"] = parse_coordinates(df["Spatial Coordinates"])
+    for position, col in enumerate(df.columns):
+        if pd.api.types.is_numeric_dtype(df[col].dtype) and not pd.api.types.is_bool_dtype(df[col].dtype):
+            arrays[f"sort_{position}"] = np.argsort(df[col].to_numpy(), kind="stable")
+    return arrays
+
+
+def _load_snapshot(version):
+    """
+    Attach the column store of `version`, publishing it first if no worker has
+    done so yet. Only the first worker pays for parsing the CSV.
+    """
+    attached = column_store.attach(version)
+    if attached is None:
+        with column_store.publish_lock():
+            attached = column_store.attach(version)
+            if attached is None:
+                df = pd.read_csv(DATASET_PATH)
+                if dataset_version() != version:
+                    # The CSV was replaced while we were reading it; let the caller retry
+                    raise RuntimeError("Dataset changed during load")
+                column_store.publish(version, df, derived_arrays(df), schema_registry.build_schema(df))
+                attached = column_store.attach(version)
+    df, arrays, _ = attached
+    return DatasetSnapshot(version, df, arrays)
+
+
+def get_snapshot():
+    """Return the snapshot for the currently published dataset version"""
+    global _snapshot
+    version = dataset_version()
+    current = _snapshot
+    if current is not None and current.version == version:
+        return current
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            print(f"Loading dataset version {version} from {DATASET_PATH}")
+            try:
+                _snapshot = _load_snapshot(version)
+            except RuntimeError:
+                version = dataset_version()
+                _snapshot = _load_snapshot(version)
+        return _snapshot
+
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def get_schema():
+    """
+    Schema registry of the currently published version. Reads only the
+    manifest (or the CSV header), never row data.
+    """
+    global _schema
+    version = dataset_version()
+    current = _schema
+    if current is not None and current.version == version and current.complete:
+        return current
+    with _schema_lock:
+        # A header-only registry is replaced once the version's manifest is published
+        if _schema is None or _schema.version != version or not _schema.complete:
+            _schema = schema_registry.load_registry(version, DATASET_PATH)
+        return _schema
+
+
+def publish_dataset(source_path=PIPELINE_OUTPUT_PATH):
+    """
+    Atomically publish a freshly generated CSV as the new dataset version.
+    Readers either see the old file or the new one, never a partial write.
+    """
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f"Pipeline output not found: {source_path}")
+    tmp_path = DATASET_PATH + ".tmp"
+    shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, DATASET_PATH)
+    return get_snapshot()
+
+
+# ============================================================================
+# DERIVED ARTIFACTS
+# ============================================================================
+
+def _to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _optional(value, default=None):
+    return default if pd.isna(value) else value
+
+
+@artifact("coordinates")
+def build_coordinates(snapshot):
+    """Valid site coordinates, from the arrays parsed once at publish time"""
+    df = snapshot.df
+    if "coords_lat" not in snapshot.arrays:
+        return pd.DataFrame({"lat": [], "lng": []}, dtype=float)
+    coords = pd.DataFrame({"lat": snapshot.arrays["coords_lat"], "lng": snapshot.arrays["coords_lng"]}, index=df.index)
+    return coords.dropna()
+
+
+@artifact("map_records")
+def build_map_records(snapshot):
+    """Marker records served by /data/map"""
+    df = snapshot.df
+    coords = snapshot.artifact("coordinates")
+    rows = df.loc[coords.index]
+    records = []
+    for (index, row), lat, lng in zip(rows.iterrows(), coords["lat"], coords["lng"]):
+        site_name = _optional(row.get("Site Name"), f"Site {index}")
+        site_type = _optional(row.get("Site Type"), "Unknown")
+        records.append({
+            "id": index,
+            "position": [lat, lng],
+            "site_name": site_name,
+            "site_type": site_type,
+            "site_voltage": _optional(row.get("Site Voltage"), "Unknown"),
+            "county": _optional(row.get("County"), "Unknown"),
+            "generation_headroom": _optional(row.get("Generation Headroom Mw")),
+            "popup_text": f"{site_name} ({site_type})",
+            "bulk_supply_point": _optional(row.get("Bulk Supply Point")),
+            "constraint_description": _optional(row.get("Constraint description")),
+            "licence_area": _optional(row.get("Licence Area")),
+        })
+    return records
+
+
+@artifact("geojson")
+def build_geojson(snapshot):
+    """FeatureCollection of all sites with valid coordinates"""
+    features = []
+    for record in snapshot.artifact("map_records"):
+        lat, lng = record["position"]
+        properties = {key: value for key, value in record.items() if key != "position"}
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lng, lat]},
+            "properties": properties,
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+@artifact("facets")
+def build_facets(snapshot):
+    """Value counts for the filterable categorical columns"""
+    df = snapshot.df
+    facets = {}
+    for col in FACET_COLUMNS:
+        if col in df.columns:
+            counts = df[col].dropna().value_counts()
+            facets[col] = [{"value": _native(value), "count": int(count)} for value, count in counts.items()]
+    return facets
+
+
+NULL_STRINGS = {"nan": None, "NaN": None, "null": None, "None": None}
+
+
+def clean_records(df):
+    """Convert a frame to JSON-compliant records (NaN/inf -> None)"""
+    text_columns = [col for col in df.columns if not pd.api.types.is_numeric_dtype(df[col])]
+    df = df.replace({float("inf"): None, float("-inf"): None})
+    df = df.astype(object).where(pd.notna(df), None)
+    for col in text_columns:
+        df[col] = df[col].replace(NULL_STRINGS)
+    records = df.to_dict("records")
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, float) and pd.isna(value):
+                record[key] = None
+    return records
+
+
+def _native(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def encode_json(payload):
+    """Encode a response payload once so it can be served as raw bytes"""
+    return json.dumps(payload, default=_native, separators=(",", ":")).encode("utf-8")
+
+
+@artifact("transformers_payload")
+def build_transformers_payload(snapshot):
+    """Encoded full-table payload served by /data/transformers"""
+    return encode_json(clean_records(snapshot.df))
@@ -0,0 +1,84 @@
+"""
+Derived columns of the final dataset for grid_and_primary_calculated.py.
+
+Every derived column is computed from whole columns (no row-wise apply) and
+carries the formula that is recorded for it with track_calculated_column, so
+the tracked description and the computation cannot drift apart.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# description / formula: recorded via track_calculated_column (None: not tracked)
+DerivedColumn = namedtuple("DerivedColumn", ["name", "description", "formula", "compute"])
+
+DEVIATION_THRESHOLD = 5.0
+
+
+def present(series):
+    """Mask of values that are neither null nor ''"""
+    return (series.notna() & (series != '')).to_numpy(dtype=bool)
+
+
+def first_present(df, primary, fallback):
+    """`primary` where present, else `fallback` where present, else None"""
+    values = np.where(
+        present(df[primary]),
+        df[primary].to_numpy(dtype=object),
+        np.where(present(df[fallback]), df[fallback].to_numpy(dtype=object), None),
+    )
+    return pd.Series(values, index=df.index)
+
+
+def deviation_percentage(df):
+    """|installed - max(Total Gen <1, Total Gen >1)| / installed * 100, 0 where installed <= 0"""
+    installed = df['installedcapacity_mva'].to_numpy(dtype=float)
+    under = df['Total Gen <1 (MW)'].to_numpy(dtype=float)
+    over = df['Total Gen >1 (MW)'].to_numpy(dtype=float)
+    # Python max() semantics: the second operand only if it compares greater
+    total_gen = np.where(over > under, over, under)
+    has_capacity = installed > 0
+    if not has_capacity.any():
+        # Same integer zeros the row-wise version produced
+        return pd.Series(0, index=df.index)
+    with np.errstate(invalid="ignore", over="ignore"):
+        deviation = np.divide(np.abs(installed - total_gen), installed, out=np.zeros(len(df)), where=has_capacity) * 100
+    return pd.Series(deviation, index=df.index)
+
+
+def deviation_flag(df):
+    return pd.Series(np.where(df['Deviation_Percentage'] > DEVIATION_THRESHOLD, "Yes", "No"), index=df.index)
+
+
+# Fill empty > 1MVA supply points from the < 1MVA register (> 1MVA wins when both are present)
+SUPPLY_POINT_COLUMNS = [
+    DerivedColumn('Grid Supply Point', None, None,
+                  lambda df: first_present(df, 'Grid Supply Point', 'Grid Supply Point Under 1MW')),
+    DerivedColumn('Bulk Supply Point', None, None,
+                  lambda df: first_present(df, 'Bulk Supply Point', 'Bulk Supply Point Under 1MW')),
+]
+
+DEVIATION_COLUMNS = [
+    DerivedColumn('Deviation_Percentage', 'Percentage deviation between Installed Capacity MVA and Max Total Gen',
+                  '|installedcapacity_mva - MAX(Total Gen <1 (MW), Total Gen >1 (MW))| / installedcapacity_mva * 100',
+                  deviation_percentage),
+    DerivedColumn('Deviation', 'Deviation flag (Yes if >5%, No if <=5%)',
+                  'Yes if Deviation_Percentage > 5%, else No',
+                  deviation_flag),
+]
+
+
+def add_derived_columns(df, columns, track=None):
+    """
+    Compute `columns` in order (later ones may use earlier ones) and record
+    the tracked ones with track(name, description, formula).
+    """
+    for column in columns:
+        df[column.name] = column.compute(df)
+    if track is not None:
+        for column in columns:
+            if column.formula is not None:
+                track(column.name, column.description, column.formula)
+    return df
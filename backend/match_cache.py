@@ -0,0 +1,127 @@
+"""
+Persistent cache of fuzzy/entity matching results across pipeline runs.
+
+Substation titles, GSP names and LTDS locations rarely change between
+refreshes, so grid_and_primary_calculated.py keeps every match it computes
+in a SQLite side file keyed by (matcher name, matcher version, normalized
+input, hash of the candidate set). A rerun only matches names that are new,
+or all names of a matcher whose candidates changed.
+
+Environment:
+  MATCH_CACHE_PATH          - SQLite file (default backend/data/match_cache.db, empty disables)
+  MATCH_CACHE_MAX_AGE_DAYS  - entries unused for this many days are dropped (default 30)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from pipeline_log import log
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "match_cache.db")
+MAX_AGE_DAYS = float(os.getenv("MATCH_CACHE_MAX_AGE_DAYS", 30))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    matcher TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    candidates_hash TEXT NOT NULL,
+    query TEXT NOT NULL,
+    match TEXT,
+    score,
+    method TEXT,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (matcher, version, candidates_hash, query)
+);
+CREATE INDEX IF NOT EXISTS idx_matches_used_at ON matches(used_at);
+"""
+
+
+def candidates_hash(*parts):
+    """Stable hash of a matcher's candidate set (order matters: it decides ties)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(list(part)).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class MatchCache:
+    """
+    Reads go straight to SQLite; new results and hit timestamps are buffered
+    and written in one transaction by flush(). `score` has no column type so
+    ints and floats come back as they were stored.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.pending = []
+        self.touched = []
+        self.stats = {}
+
+    def _count(self, matcher, field):
+        counts = self.stats.setdefault(matcher.NAME, {"hits": 0, "computed": 0})
+        counts[field] += 1
+
+    def get(self, matcher, query):
+        """(match, score, method) stored for `query`, or None on a miss"""
+        row = self.conn.execute(
+            "SELECT match, score, method FROM matches"
+            " WHERE matcher = ? AND version = ? AND candidates_hash = ? AND query = ?",
+            (matcher.NAME, matcher.VERSION, matcher.candidates_hash, query),
+        ).fetchone()
+        if row is None:
+            self._count(matcher, "computed")
+            return None
+        self._count(matcher, "hits")
+        self.touched.append((time.time(), matcher.NAME, matcher.VERSION, matcher.candidates_hash, query))
+        match, score, method = row
+        return (None if match is None else json.loads(match)), score, method
+
+    def put(self, matcher, query, match, score, method):
+        try:
+            encoded = None if match is None else json.dumps(match)
+        except TypeError:
+            # Not JSON-serializable: just don't persist it
+            log.debug("Match cache: not storing %s match for %r (%s is not JSON-serializable)",
+                      matcher.NAME, query, type(match).__name__)
+            return
+        self.pending.append((matcher.NAME, matcher.VERSION, matcher.candidates_hash, query, encoded, score, method, time.time()))
+
+    def flush(self):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+            self.conn.executemany(
+                "UPDATE matches SET used_at = ?"
+                " WHERE matcher = ? AND version = ? AND candidates_hash = ? AND query = ?",
+                self.touched,
+            )
+        self.pending = []
+        self.touched = []
+
+    def close(self):
+        self.flush()
+        with self.conn:
+            self.conn.execute("DELETE FROM matches WHERE used_at < ?", (time.time() - MAX_AGE_DAYS * 86400,))
+        self.conn.close()
+
+    def summary(self):
+        """Cache hits vs computed matches per matcher for this run"""
+        return {name: dict(counts) for name, counts in self.stats.items()}
+
+
+def open_match_cache():
+    """The configured MatchCache, or None when disabled or unavailable"""
+    path = os.getenv("MATCH_CACHE_PATH", DEFAULT_PATH)
+    if not path:
+        return None
+    try:
+        return MatchCache(path)
+    except sqlite3.Error as e:
+        log.warning(f"Match cache unavailable ({path}): {e}")
+        return None
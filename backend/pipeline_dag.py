@@ -0,0 +1,265 @@
+"""
+Stage runner with checkpointed artifacts for grid_and_primary_calculated.py.
+
+Every stage declares the artifacts (DataFrames) it reads and the ones it
+produces. After a stage runs, its outputs are checkpointed under
+PIPELINE_CHECKPOINT_DIR with a fingerprint of the stage's code, the
+pipeline parameters and its input artifacts. The next run reuses the
+checkpoint instead of running the stage while that fingerprint matches.
+Fetch stages (always_run) read the database every run, but when they
+return the same data as last time the stages after them are reused.
+
+run_stages(..., start=STAGE) reruns STAGE and runs the stages downstream of
+it as usual, loading every other stage's outputs from its last checkpoint
+as-is (no database access, no fingerprint check); stop=STAGE only runs
+STAGE and the stages it depends on.
+
+Stages may also update a dict-of-dicts `state` (the column tracking); the
+changes a stage makes are stored with its checkpoint and replayed when it
+is reused, so the state ends up the same either way.
+
+Checkpoints are Parquet files. Parquet cannot keep object columns that mix
+types or NaN and None apart, both of which the pipeline's merges produce,
+so such frames (and every frame when pyarrow is not installed) are stored
+as pandas pickles to keep reused results identical to recomputed ones.
+
+Environment:
+  PIPELINE_CHECKPOINT_DIR - checkpoint directory (default backend/data/checkpoints, empty disables)
+"""
+
+import copy
+import hashlib
+import inspect
+import json
+import os
+import shutil
+from collections import namedtuple
+
+import pandas as pd
+
+import pipeline_log
+from pipeline_log import plain
+
+try:
+    import pyarrow  # noqa: F401  (pandas' Parquet engine)
+except ImportError:
+    pyarrow = None
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "checkpoints")
+CHECKPOINT_DIR = os.getenv("PIPELINE_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+
+# run(**inputs) -> {output name: DataFrame}; always_run: rerun even when the fingerprint matches
+PipelineStage = namedtuple("PipelineStage", ["name", "inputs", "outputs", "run", "always_run"], defaults=(False,))
+
+PARQUET_SAFE_KINDS = set("biufM")
+
+
+class CheckpointMissing(Exception):
+    pass
+
+
+def source_hash(*objects):
+    """Hash of the source code of modules/functions a stage depends on besides its own function"""
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def frame_fingerprint(df):
+    """Content hash of a DataFrame (values, index, column names and dtypes)"""
+    digest = hashlib.sha256()
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in df.dtypes.items()]).encode("utf-8"))
+    try:
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    except TypeError:
+        # Unhashable cells (lists, dicts): fall back to the pickled frame
+        digest.update(pd.io.pickle.pickle.dumps(df))
+    return digest.hexdigest()
+
+
+def stage_fingerprint(stage, input_fingerprints, params):
+    digest = hashlib.sha256()
+    try:
+        source = inspect.getsource(stage.run)
+    except (OSError, TypeError):
+        source = getattr(stage.run, "__qualname__", repr(stage.run))
+    for part in (stage.name, source, repr(sorted(params.items())), *input_fingerprints):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def parquet_safe(df):
+    """Whether a Parquet round trip gives back exactly `df`"""
+    if pyarrow is None or not df.columns.is_unique or not all(isinstance(c, str) for c in df.columns):
+        return False
+    if not (isinstance(df.index, pd.RangeIndex) or df.index.dtype.kind in "iu"):
+        return False
+    if df.index.name is not None and not isinstance(df.index.name, str):
+        return False
+    for column, dtype in df.dtypes.items():
+        if dtype == object:
+            types = set(map(type, df[column].to_numpy()))
+            if not types <= {str, type(None)}:
+                return False
+        elif dtype.kind not in PARQUET_SAFE_KINDS:
+            return False
+    return True
+
+
+def state_delta(before, after):
+    """Entries of a dict-of-dicts that `after` added or changed relative to `before`"""
+    delta = {}
+    for section, entries in after.items():
+        old = before.get(section, {})
+        changed = {key: value for key, value in entries.items() if key not in old or old[key] != value}
+        if changed:
+            delta[section] = changed
+    return delta
+
+
+class Checkpoints:
+    """One directory per stage: its output files plus meta.json, written last"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def stage_dir(self, stage):
+        return os.path.join(self.root, stage.name)
+
+    def meta(self, stage):
+        if not self.root:
+            return None
+        try:
+            with open(os.path.join(self.stage_dir(stage), "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, stage, meta, output):
+        path = os.path.join(self.stage_dir(stage), meta["outputs"][output]["file"])
+        return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_pickle(path)
+
+    def save(self, stage, fingerprint, outputs, output_fingerprints, delta, stage_log):
+        if not self.root:
+            return
+        directory = self.stage_dir(stage)
+        # Drop the old checkpoint first so a crash never leaves meta.json next to new files
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        files = {}
+        for name, df in outputs.items():
+            if parquet_safe(df):
+                file_name = f"{name}.parquet"
+                df.to_parquet(os.path.join(directory, file_name))
+            else:
+                file_name = f"{name}.pkl"
+                df.to_pickle(os.path.join(directory, file_name))
+            files[name] = {"file": file_name, "fingerprint": output_fingerprints[name]}
+        meta = {
+            "stage": stage.name,
+            "fingerprint": fingerprint,
+            "outputs": files,
+            "state_delta": delta,
+            "counters": {counter: plain(value) for counter, value in stage_log.counters.items()},
+            "rows_in": stage_log.rows_in,
+            "rows": stage_log.rows,
+        }
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+
+def select_stages(stages, start=None, stop=None):
+    """Stages to execute and the subset of them to (re)run from `start` on"""
+    by_name = {stage.name: stage for stage in stages}
+    producer = {}
+    for stage in stages:
+        for name in stage.inputs:
+            if name not in producer:
+                raise ValueError(f"Stage {stage.name} reads {name} before any stage produces it")
+        for name in stage.outputs:
+            producer[name] = stage.name
+    for name in (start, stop):
+        if name is not None and name not in by_name:
+            raise ValueError(f"Unknown stage {name}; stages are: {', '.join(by_name)}")
+
+    selected = [stage.name for stage in stages]
+    if stop is not None:
+        needed = {stop}
+        for stage in reversed(stages):
+            if stage.name in needed:
+                needed.update(producer[name] for name in stage.inputs)
+        selected = [name for name in selected if name in needed]
+
+    downstream = set(selected)
+    if start is not None:
+        downstream = {start}
+        for stage in stages:
+            if any(producer[name] in downstream for name in stage.inputs):
+                downstream.add(stage.name)
+    return [by_name[name] for name in selected], downstream
+
+
+def run_stages(stages, params, state, checkpoint_dir=CHECKPOINT_DIR, start=None, stop=None):
+    """
+    Execute `stages` in list order (each stage's inputs must come from an
+    earlier stage), reusing checkpoints where possible. Returns the
+    artifacts computed or loaded by this run.
+    """
+    selected, downstream = select_stages(stages, start, stop)
+    checkpoints = Checkpoints(checkpoint_dir)
+    artifacts = {}
+    fingerprints = {}
+    # Outputs of reused stages are only read from disk when a later stage needs them
+    pending = {}
+
+    def artifact(name):
+        if name not in artifacts:
+            stage, meta = pending[name]
+            artifacts[name] = checkpoints.load(stage, meta, name)
+        return artifacts[name]
+
+    for stage in selected:
+        stage_log = pipeline_log.stage(stage.name)
+        meta = checkpoints.meta(stage)
+        fingerprint = None
+        if start is not None and stage.name not in downstream:
+            if meta is None:
+                raise CheckpointMissing(f"No checkpoint for stage {stage.name} in {checkpoint_dir or '(checkpoints disabled)'}")
+            reuse = True
+        else:
+            fingerprint = stage_fingerprint(stage, [fingerprints[name] for name in stage.inputs], params)
+            reuse = (not stage.always_run and stage.name != start
+                     and meta is not None and meta["fingerprint"] == fingerprint)
+
+        if reuse:
+            for name in stage.outputs:
+                pending[name] = (stage, meta)
+                artifacts.pop(name, None)
+                fingerprints[name] = meta["outputs"][name]["fingerprint"]
+            for section, entries in meta["state_delta"].items():
+                state.setdefault(section, {}).update(entries)
+            stage_log.reused = True
+            stage_log.rows_in = meta["rows_in"]
+            stage_log.end(rows=meta["rows"], **meta["counters"])
+            continue
+
+        inputs = {name: artifact(name) for name in stage.inputs}
+        if inputs:
+            stage_log.rows_in = len(inputs[stage.inputs[0]])
+        before = copy.deepcopy(state)
+        outputs = stage.run(**inputs)
+        missing = set(stage.outputs) - set(outputs)
+        if missing:
+            raise RuntimeError(f"Stage {stage.name} did not produce {', '.join(sorted(missing))}")
+        # No-op when the stage function already ended its stage with its own counters
+        stage_log.end(rows=len(outputs[stage.outputs[-1]]))
+        output_fingerprints = {name: frame_fingerprint(outputs[name]) for name in stage.outputs}
+        for name in stage.outputs:
+            pending.pop(name, None)
+            artifacts[name] = outputs[name]
+        fingerprints.update(output_fingerprints)
+        checkpoints.save(stage, fingerprint, outputs, output_fingerprints, state_delta(before, state), stage_log)
+
+    return artifacts
@@ -0,0 +1,206 @@
+"""
+Leveled logging for grid_and_primary_calculated.py.
+
+The pipeline logs through the "pipeline" logger:
+  INFO     one summary line per stage (wall time, rows, counters)
+  WARNING  / ERROR problems, written to stderr so a failed run reports them
+  DEBUG    progress messages, statistics and sample rows
+
+Per-record messages inside loops go through Stage.sample(), which always
+counts them but only formats and logs every Nth one, and only at DEBUG.
+
+Every stage is also profiled (wall time, CPU time, rows in/out, peak RSS)
+and finish() writes the run's profile to pipeline_profile.json. Stages
+named in configure(profile_stages=...) run under cProfile, with the stats
+dumped to pipeline_profile_<stage>.prof.
+
+Environment:
+  PIPELINE_LOG_LEVEL   - INFO (default), DEBUG, WARNING or ERROR
+  PIPELINE_LOG_SAMPLE  - log every Nth per-record message at DEBUG (default 50, 1 logs all)
+  PIPELINE_TRACEMALLOC - 1: also record each stage's peak traced Python allocations (slower)
+"""
+
+import cProfile
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+log = logging.getLogger("pipeline")
+
+SAMPLE_EVERY = max(1, int(os.getenv("PIPELINE_LOG_SAMPLE", 50)))
+TRACE_ALLOCATIONS = os.getenv("PIPELINE_TRACEMALLOC", "") not in ("", "0")
+
+PROFILE_PATH = "pipeline_profile.json"
+# Stage names to run under cProfile ("all" for every stage)
+profile_stages = set()
+
+
+class _BelowWarning(logging.Filter):
+    def filter(self, record):
+        return record.levelno < logging.WARNING
+
+
+def configure(profile=()):
+    """
+    Route the pipeline logger to stdout (below WARNING) and stderr, at
+    PIPELINE_LOG_LEVEL; `profile` names the stages to run under cProfile.
+    """
+    profile_stages.update(profile)
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+    stdout = logging.StreamHandler(sys.stdout)
+    stdout.addFilter(_BelowWarning())
+    stderr = logging.StreamHandler(sys.stderr)
+    stderr.setLevel(logging.WARNING)
+    for handler in (stdout, stderr):
+        handler.setFormatter(formatter)
+        log.addHandler(handler)
+    log.setLevel(os.getenv("PIPELINE_LOG_LEVEL", "INFO").upper())
+    log.propagate = False
+    return log
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, KB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def plain(value):
+    """numpy scalars as Python numbers, for JSON"""
+    return value.item() if hasattr(value, "item") else value
+
+
+def debug_enabled():
+    """Whether DEBUG output is on; guard expensive debug-only work (samples, dumps) with it"""
+    return log.isEnabledFor(logging.DEBUG)
+
+
+class Stage:
+    """One pipeline section: counters, resource usage and a summary line when it ends"""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.counters = Counter()
+        self.rows_in = rows_in
+        self.rows = None
+        self.elapsed = None
+        self.cpu = None
+        self.peak_rss_mb = None
+        self.rss_growth_mb = None
+        self.traced_peak_mb = None
+        self.profile_path = None
+        # Outputs loaded from a checkpoint instead of computed (see pipeline_dag.py)
+        self.reused = False
+        log.debug("== %s ==", name)
+        self.rss_at_start = peak_rss_mb()
+        if TRACE_ALLOCATIONS:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.traced_at_start = tracemalloc.get_traced_memory()[0]
+        self.profiler = None
+        if name in profile_stages or "all" in profile_stages:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def sample(self, counter, message, *args):
+        """Count one `counter` event; log `message % args` for every SAMPLE_EVERY-th of them"""
+        self.counters[counter] += 1
+        if (self.counters[counter] - 1) % SAMPLE_EVERY == 0 and log.isEnabledFor(logging.DEBUG):
+            log.debug(message, *args)
+
+    def end(self, rows=None, **counters):
+        """Log the stage summary; `rows` is the stage's output row count, `counters` are set as given"""
+        if self.elapsed is not None:
+            return
+        self.elapsed = time.perf_counter() - self.started
+        self.cpu = time.process_time() - self.started_cpu
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profile_path = f"pipeline_profile_{self.name}.prof"
+            self.profiler.dump_stats(self.profile_path)
+        if TRACE_ALLOCATIONS:
+            self.traced_peak_mb = (tracemalloc.get_traced_memory()[1] - self.traced_at_start) / (1024 * 1024)
+        self.peak_rss_mb = peak_rss_mb()
+        if self.peak_rss_mb is not None:
+            # Peak RSS only grows: this is how far the stage pushed the process peak
+            self.rss_growth_mb = self.peak_rss_mb - self.rss_at_start
+        if rows is not None:
+            self.rows = int(rows)
+        for counter, value in counters.items():
+            self.counters[counter] = value
+        details = [f"rows={self.rows}"] if self.rows is not None else []
+        details += [f"{counter}={value}" for counter, value in self.counters.items()]
+        if self.reused:
+            details.append("(reused)")
+        log.info("%-20s %7.2fs %s", self.name, self.elapsed, " ".join(details) or "-")
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "wall_s": round(self.elapsed, 4),
+            "cpu_s": round(self.cpu, 4),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows,
+            "peak_rss_mb": None if self.peak_rss_mb is None else round(self.peak_rss_mb, 1),
+            "rss_growth_mb": None if self.rss_growth_mb is None else round(self.rss_growth_mb, 1),
+            "traced_peak_mb": None if self.traced_peak_mb is None else round(self.traced_peak_mb, 1),
+            "counters": {counter: plain(value) for counter, value in self.counters.items()},
+            "cprofile": self.profile_path,
+            "reused": self.reused,
+        }
+
+
+stages = []
+
+
+def stage(name, rows_in=None):
+    """End the running stage (if still open) and start `name`; rows_in defaults to the previous stage's rows"""
+    if stages:
+        stages[-1].end()
+        if rows_in is None:
+            rows_in = stages[-1].rows
+    stages.append(Stage(name, rows_in))
+    return stages[-1]
+
+
+def current_stage():
+    """The most recently started stage"""
+    return stages[-1]
+
+
+def finish(profile_path=PROFILE_PATH):
+    """End the last stage, log the run's total time and write the stage profile to `profile_path`"""
+    if not stages:
+        return
+    stages[-1].end()
+    total = sum(s.elapsed for s in stages)
+    log.info("%-20s %7.2fs stages=%d", "total", total, len(stages))
+    profile = {
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "wall_s": round(total, 4),
+        "cpu_s": round(sum(s.cpu for s in stages), 4),
+        "peak_rss_mb": stages[-1].as_dict()["peak_rss_mb"],
+        "stages": [s.as_dict() for s in stages],
+    }
+    with open(profile_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    log.info("Stage profile saved to: %s", profile_path)
@@ -0,0 +1,164 @@
+"""
+In-app scheduler for periodic dataset refreshes.
+
+Configured through environment variables:
+  DATA_REFRESH_INTERVAL  - run every N seconds
+  DATA_REFRESH_CRON      - five-field cron expression ("m h dom mon dow"),
+                           takes precedence over the interval
+If neither is set the scheduler stays disabled.
+"""
+
+import datetime
+import os
+import threading
+import time
+import traceback
+
+CRON_FIELD_RANGES = [
+    (0, 59),  # minute
+    (0, 23),  # hour
+    (1, 31),  # day of month
+    (1, 12),  # month
+    (0, 6),   # day of week (0 = Sunday)
+]
+
+
+def _parse_cron_field(field, low, high):
+    """Expand one cron field ("*", "*/15", "1-5", "0,30", "8-18/2") into a set of values"""
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            step = int(step_str)
+            if step <= 0:
+                raise ValueError(f"Invalid cron step: {step_str}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_str, end_str = part.split("-", 1)
+            start, end = int(start_str), int(end_str)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field '{field}' out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Minimal five-field cron expression evaluator"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields, got: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELD_RANGES)
+        ]
+        # Standard cron semantics: when both day fields are restricted, either may match
+        self.days_restricted = fields[2] != "*"
+        self.weekdays_restricted = fields[4] != "*"
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.isoweekday() % 7) in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment):
+        """Return the first matching minute strictly after `moment`"""
+        candidate = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = candidate + datetime.timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + datetime.timedelta(hours=1)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += datetime.timedelta(minutes=1)
+                continue
+            return candidate
+        raise ValueError(f"Cron expression never fires: '{self.expression}'")
+
+
+class IntervalSchedule:
+    """Fixed-interval schedule"""
+
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError("Refresh interval must be positive")
+        self.seconds = seconds
+
+    def next_after(self, moment):
+        return moment + datetime.timedelta(seconds=self.seconds)
+
+
+def schedule_from_env():
+    """Build the configured schedule, or None when scheduled refresh is disabled"""
+    cron = os.getenv("DATA_REFRESH_CRON", "").strip()
+    if cron:
+        return CronSchedule(cron)
+    interval = os.getenv("DATA_REFRESH_INTERVAL", "").strip()
+    if interval:
+        return IntervalSchedule(float(interval))
+    return None
+
+
+class RefreshScheduler:
+    """Runs `job` on a background thread according to `schedule`"""
+
+    def __init__(self, job, schedule):
+        self.job = job
+        self.schedule = schedule
+        self.next_run = None
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="data-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def status(self):
+        return {
+            "enabled": True,
+            "schedule": getattr(self.schedule, "expression", None) or f"every {self.schedule.seconds:g}s",
+            "next_run": self.next_run.isoformat() if self.next_run else None,
+            "last_run": self.last_run,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.next_run = self.schedule.next_after(datetime.datetime.now())
+            wait = (self.next_run - datetime.datetime.now()).total_seconds()
+            if self._stop.wait(max(wait, 0)):
+                break
+            started_at = datetime.datetime.now().isoformat()
+            started = time.perf_counter()
+            print(f"Scheduled data refresh starting at {started_at}")
+            try:
+                result = self.job()
+            except Exception as e:
+                traceback.print_exc()
+                result = {"status": "error", "message": str(e)}
+            result = dict(result or {})
+            result["started_at"] = started_at
+            result["duration_s"] = round(time.perf_counter() - started, 2)
+            self.last_run = result
+            print(f"Scheduled data refresh finished: {result}")
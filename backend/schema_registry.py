@@ -0,0 +1,69 @@
+"""
+Schema registry of the published dataset.
+
+The schema (column names, dtypes, nullability, categorical flags) is built
+once when a dataset version is published and stored in that version's
+column-store manifest. View validation and /api/schema read it from there,
+so checking a column name never touches row data. Versions published
+without a schema fall back to the CSV header (names only).
+"""
+
+import pandas as pd
+
+import column_store
+
+# Text columns with at most this many distinct values are flagged categorical
+CATEGORICAL_MAX_DISTINCT = 50
+
+
+def build_schema(df):
+    """Describe every column of a freshly parsed dataset"""
+    schema = []
+    for col in df.columns:
+        series = df[col]
+        numeric = pd.api.types.is_numeric_dtype(series.dtype)
+        distinct = int(series.nunique(dropna=True))
+        schema.append({
+            "name": col,
+            "dtype": str(series.dtype),
+            "nullable": bool(series.isna().any()),
+            "categorical": not numeric and distinct <= CATEGORICAL_MAX_DISTINCT,
+            "distinct": distinct,
+        })
+    return schema
+
+
+class SchemaRegistry:
+    """Column metadata of one dataset version with O(1) name lookups"""
+
+    def __init__(self, version, columns, complete=True):
+        self.version = version
+        # False when only the CSV header was available (no dtypes / flags yet)
+        self.complete = complete
+        self.columns = {column["name"]: column for column in columns}
+        self.names = frozenset(self.columns)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def as_dict(self):
+        return {"version": self.version, "complete": self.complete, "columns": list(self.columns.values())}
+
+
+def load_registry(version, csv_path):
+    """Registry of `version` from its manifest, or from the CSV header if it has none"""
+    manifest = column_store.read_manifest(version)
+    if manifest is not None and "schema" in manifest:
+        return SchemaRegistry(version, manifest["schema"])
+    header = pd.read_csv(csv_path, nrows=0)
+    columns = [
+        {"name": col, "dtype": None, "nullable": None, "categorical": None, "distinct": None}
+        for col in header.columns
+    ]
+    return SchemaRegistry(version, columns, complete=False)
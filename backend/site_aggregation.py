@@ -0,0 +1,298 @@
+"""
+Per-site aggregations of the source tables for grid_and_primary_calculated.py.
+
+Capacities are parsed to Decimals, summed exactly and rounded to a float once
+per site, so a sum does not depend on the order of the rows. With
+AGGREGATION_MODE=sql the same sums are taken in PostgreSQL (numeric SUM is
+exact too) and only one row per site is transferred; both paths then build
+their result with the same functions below.
+"""
+
+import decimal
+import re
+from decimal import Decimal
+
+import pandas as pd
+
+from site_matching import normalize_site_location
+
+SITE_KEY = "sitefunctionallocation"
+
+ECR_ALREADY_CONNECTED = "already_connected_registered_capacity_mw"
+ECR_ACCEPTED_TO_CONNECT = "accepted_to_connect_registered_capacity_mw"
+ECR_COLUMNS = [SITE_KEY, ECR_ALREADY_CONNECTED, ECR_ACCEPTED_TO_CONNECT, "connection_status", "grid_supply_point", "bulk_supply_point"]
+
+# A capacity is a decimal number or inf/infinity (any case), optionally signed
+# and surrounded by ASCII whitespace; anything else (NULL, '', 'nan', text)
+# counts as 0. Digit runs and exponents are bounded so that every accepted
+# value fits PostgreSQL's numeric type. The patterns are written to mean the
+# same as Python and as PostgreSQL regular expressions.
+ASCII_WHITESPACE = " \t\n\x0b\x0c\r"
+CAPACITY_SPACE = r"[ \t\n\v\f\r]*"
+FINITE_CAPACITY = (
+    CAPACITY_SPACE
+    + r"[-+]?([0-9]{1,255}(\.[0-9]{0,255})?|\.[0-9]{1,255})([eE][-+]?0*[0-9]{1,3})?"
+    + CAPACITY_SPACE
+)
+POSITIVE_INFINITY = CAPACITY_SPACE + r"[+]?[iI][nN][fF]([iI][nN][iI][tT][yY])?" + CAPACITY_SPACE
+NEGATIVE_INFINITY = CAPACITY_SPACE + r"-[iI][nN][fF]([iI][nN][iI][tT][yY])?" + CAPACITY_SPACE
+CAPACITY_PATTERN = re.compile(f"{FINITE_CAPACITY}|{POSITIVE_INFINITY}|{NEGATIVE_INFINITY}")
+
+# Exact arithmetic: no rounding, and inf + -inf gives NaN instead of raising
+EXACT = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN, traps=[])
+ZERO = Decimal(0)
+INFINITY = Decimal("Infinity")
+
+# The characters str.strip() removes (str.isspace())
+PYTHON_WHITESPACE = (
+    "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005"
+    "\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000"
+)
+
+
+def parse_capacity(value):
+    """
+    Capacity value as a Decimal (see FINITE_CAPACITY). Other types are read
+    through str(), as the database reads a non-text column through ::text.
+    """
+    if value is None:
+        return ZERO
+    text = value if isinstance(value, str) else str(value)
+    if CAPACITY_PATTERN.fullmatch(text) is None:
+        return ZERO
+    return Decimal(text.strip(ASCII_WHITESPACE))
+
+
+def parse_capacities(column):
+    """parse_capacity() of every value of a column, as an object Series of Decimals"""
+    return pd.Series([parse_capacity(value) for value in column], index=column.index, dtype=object)
+
+
+def ecr_query(table):
+    """Query reading an ECR table for aggregate_ecr(), in table order"""
+    columns = ", ".join(f'"{column}"' for column in ECR_COLUMNS)
+    return f"SELECT {columns} FROM {table} ORDER BY ctid"
+
+
+# Rows of ltds_table_5_generation for prepare_ltds(), in table order
+LTDS_QUERY = f"""
+SELECT "{SITE_KEY}", "installedcapacity_mva"
+FROM ltds_table_5_generation
+WHERE "installedcapacity_mva" IS NOT NULL
+ORDER BY ctid
+"""
+
+
+def capacity_total(finite_sum, positive_infinities=0, negative_infinities=0):
+    """Exact sum of a finite part and counts of +inf / -inf capacities"""
+    total = Decimal(finite_sum)
+    if positive_infinities:
+        total = EXACT.add(total, INFINITY)
+    if negative_infinities:
+        total = EXACT.add(total, -INFINITY)
+    return total
+
+
+def ecr_status_masks(status):
+    """
+    Connection-status masks of a cleaned connection_status column:
+    - already connected: status contains 'Connected' (any case) OR blank/null
+    - accepted to connect: status contains 'Accepted to Connect' OR blank/null
+    """
+    blank = (status == '') | status.isna()
+    already = status.str.contains('Connected', case=False, regex=False, na=False) | blank
+    accepted = status.str.contains('Accepted to Connect', case=False, regex=False, na=False) | blank
+    return already.to_numpy(dtype=bool), accepted.to_numpy(dtype=bool)
+
+
+def first_rows(df, key, columns):
+    """Value of `columns` in each key's first row (groupby 'first' would skip nulls)"""
+    firsts = df.loc[~df[key].isna(), [key] + columns].drop_duplicates(subset=key)
+    return firsts.set_index(key)
+
+
+def ecr_frame(totals, supply_points):
+    """
+    aggregate_ecr() result from exact per-site totals ({site: [already
+    connected, accepted to connect]}) and each site's first supply points.
+    Sites are sorted by code point, as groupby sorts them.
+    """
+    sites = sorted(totals)
+    sums = pd.DataFrame({
+        SITE_KEY: sites,
+        'Already connected sum': [float(totals[site][0]) for site in sites],
+        'Accepted to Connect sum': [float(totals[site][1]) for site in sites],
+    })
+    supply_points = supply_points.rename(columns={
+        'grid_supply_point': 'Grid Supply Point',
+        'bulk_supply_point': 'Bulk Supply Point',
+    })
+    return sums.join(supply_points, on=SITE_KEY)
+
+
+def clean_ecr(df_ecr):
+    """ECR rows with parsed capacities and connection_status stripped (null -> '')"""
+    df_ecr = df_ecr.copy()
+    df_ecr[ECR_ALREADY_CONNECTED] = parse_capacities(df_ecr[ECR_ALREADY_CONNECTED])
+    df_ecr[ECR_ACCEPTED_TO_CONNECT] = parse_capacities(df_ecr[ECR_ACCEPTED_TO_CONNECT])
+    df_ecr['connection_status'] = df_ecr['connection_status'].fillna("").str.strip()
+    return df_ecr
+
+
+def aggregate_ecr(df_ecr):
+    """
+    Aggregate an ECR table (cleaned with clean_ecr(), rows in table order) to one row per
+    sitefunctionallocation with the connection-status logic:
+    'Already connected sum', 'Accepted to Connect sum' and the site's first
+    'Grid Supply Point' / 'Bulk Supply Point'.
+    """
+    already, accepted = ecr_status_masks(df_ecr['connection_status'])
+    totals = {}
+    for site, already_mw, accepted_mw, is_already, is_accepted in zip(
+            df_ecr[SITE_KEY], df_ecr[ECR_ALREADY_CONNECTED], df_ecr[ECR_ACCEPTED_TO_CONNECT], already, accepted):
+        if pd.isna(site):
+            continue
+        site_totals = totals.setdefault(site, [ZERO, ZERO])
+        if is_already:
+            site_totals[0] = EXACT.add(site_totals[0], already_mw)
+        if is_accepted:
+            site_totals[1] = EXACT.add(site_totals[1], accepted_mw)
+    return ecr_frame(totals, first_rows(df_ecr, SITE_KEY, ['grid_supply_point', 'bulk_supply_point']))
+
+
+def aggregate_ltds(locations, capacities):
+    """
+    Installed capacity summed per normalized sitefunctionallocation, with the
+    group's first non-null location. `locations` are in table order and
+    `capacities` are exact (Decimal) values.
+    """
+    totals, firsts = {}, {}
+    for location, capacity in zip(locations, capacities):
+        key = normalize_site_location(location)
+        totals[key] = EXACT.add(totals.get(key, ZERO), capacity)
+        if firsts.get(key) is None:
+            firsts[key] = None if pd.isna(location) else location
+    keys = sorted(totals)
+    return pd.DataFrame({
+        f'{SITE_KEY}_normalized': keys,
+        'installedcapacity_mva': [float(totals[key]) for key in keys],
+        SITE_KEY: [firsts[key] for key in keys],
+    })
+
+
+def prepare_ltds(df_ltds):
+    """
+    Rows of ltds_table_5_generation (in table order) with a positive capacity,
+    capacities as floats, and aggregate_ltds() of them
+    """
+    capacities = parse_capacities(df_ltds['installedcapacity_mva'])
+    positive = capacities > 0
+    df_ltds = df_ltds[positive.to_numpy(dtype=bool)].copy()
+    df_ltds['installedcapacity_mva'] = [float(capacity) for capacity in capacities[positive]]
+    return df_ltds, aggregate_ltds(df_ltds[SITE_KEY], capacities[positive])
+
+
+# ---------------------------------------------------------------------------
+# SQL pushdown (AGGREGATION_MODE=sql): the database filters, groups and sums
+# (exactly, in numeric); Python rounds the sums and normalizes the LTDS keys,
+# since PostgreSQL's upper() is not Python's Unicode str.upper().
+# - "First" is first in ctid order, and the pandas path reads the tables
+#   ORDER BY ctid as well.
+# - Capacities are read as ::text and matched against the patterns above.
+#   A double precision column therefore relies on the default
+#   extra_float_digits, whose shortest round-trip text is what str() gives.
+# - The status check uses ILIKE under the "C" collation, which folds ASCII
+#   letters only. That matches str.upper() containment except where a
+#   non-ASCII character upper-cases into a phrase: only 'ẗ' (-> 'T' and a
+#   combining diaeresis) ending 'Accepted to Connect', listed as a pattern of
+#   its own (test_site_aggregation.py checks the running Python's Unicode tables).
+# ---------------------------------------------------------------------------
+
+def sql_string(chars):
+    """PostgreSQL string literal of `chars` (needs a UTF8 database for non-ASCII)"""
+    return "E'" + "".join(f"\\u{ord(char):04x}" for char in chars) + "'"
+
+
+def sql_capacity_sums(column, condition, name):
+    """
+    SQL select items for the exact sum of parse_capacity(column) over the rows
+    matching `condition`: the finite part as numeric text and the +inf / -inf counts
+    """
+    text = f'"{column}"::text'
+    return (
+        f"coalesce(SUM(CASE WHEN {text} ~ '^({FINITE_CAPACITY})$' THEN {text}::numeric END) "
+        f"FILTER (WHERE {condition}), 0)::text AS \"{name}\",\n"
+        f"        count(*) FILTER (WHERE ({condition}) AND {text} ~ '^({POSITIVE_INFINITY})$') AS \"{name} +inf\",\n"
+        f"        count(*) FILTER (WHERE ({condition}) AND {text} ~ '^({NEGATIVE_INFINITY})$') AS \"{name} -inf\""
+    )
+
+
+def sql_first(column):
+    """SQL for the value of `column` in the group's first row (nulls included)"""
+    return f'(array_agg("{column}" ORDER BY ctid))[1]'
+
+
+def ecr_aggregate_query(table):
+    """GROUP BY query with the per-site inputs of aggregate_ecr() over an ECR table"""
+    status = 'connection_status::text'
+    blank = f"btrim(coalesce({status}, ''), {sql_string(PYTHON_WHITESPACE)}) = ''"
+    already = f"{blank} OR {status} COLLATE \"C\" ILIKE '%connected%'"
+    accepted = (
+        f"{blank} OR {status} COLLATE \"C\" ILIKE '%accepted to connect%'"
+        f" OR {status} COLLATE \"C\" ILIKE '%accepted to connec' || {sql_string(chr(0x1e97))} || '%'"
+    )
+    return f"""
+    SELECT
+        "{SITE_KEY}",
+        {sql_capacity_sums(ECR_ALREADY_CONNECTED, already, 'already')},
+        {sql_capacity_sums(ECR_ACCEPTED_TO_CONNECT, accepted, 'accepted')},
+        {sql_first('grid_supply_point')} AS grid_supply_point,
+        {sql_first('bulk_supply_point')} AS bulk_supply_point
+    FROM {table}
+    WHERE "{SITE_KEY}" IS NOT NULL
+    GROUP BY "{SITE_KEY}"
+    """
+
+
+def fetch_ecr_aggregated(conn, table):
+    """aggregate_ecr() of `table`, summed by the database"""
+    rows = pd.read_sql_query(ecr_aggregate_query(table), conn)
+    totals = {
+        site: [capacity_total(*sums[0:3]), capacity_total(*sums[3:6])]
+        for site, *sums in rows[[SITE_KEY] + [
+            f'{name}{suffix}' for name in ('already', 'accepted') for suffix in ('', ' +inf', ' -inf')
+        ]].itertuples(index=False)
+    }
+    return ecr_frame(totals, rows.set_index(SITE_KEY)[['grid_supply_point', 'bulk_supply_point']])
+
+
+# One row per distinct sitefunctionallocation with a positive capacity, in
+# order of first appearance (ctid): its first capacity (as text, parsed by
+# parse_capacity()) and its exact capacity sum. Every enhanced-matching
+# strategy picks the first row whose location satisfies a predicate, so the
+# first rows give the same answers as the full table read in that order.
+LTDS_CAPACITY = '"installedcapacity_mva"::text'
+LTDS_SITES_QUERY = f"""
+SELECT
+    "{SITE_KEY}",
+    (array_agg({LTDS_CAPACITY} ORDER BY ctid))[1] AS "installedcapacity_mva",
+    {sql_capacity_sums("installedcapacity_mva", 'true', 'capacity')}
+FROM ltds_table_5_generation
+WHERE CASE WHEN {LTDS_CAPACITY} ~ '^({FINITE_CAPACITY})$' THEN {LTDS_CAPACITY}::numeric > 0
+           ELSE {LTDS_CAPACITY} ~ '^({POSITIVE_INFINITY})$' END
+GROUP BY "{SITE_KEY}"
+ORDER BY (array_agg(ctid ORDER BY ctid))[1]
+"""
+
+
+def fetch_ltds(conn):
+    """
+    prepare_ltds() of ltds_table_5_generation with the sums taken by the
+    database: the first row of each sitefunctionallocation (input for the
+    enhanced matching) and the capacity summed per normalized location
+    """
+    rows = pd.read_sql_query(LTDS_SITES_QUERY, conn)
+    capacities = [capacity_total(finite, infinities) for finite, infinities in zip(rows['capacity'], rows['capacity +inf'])]
+    df_ltds = rows[[SITE_KEY, 'installedcapacity_mva']].copy()
+    df_ltds['installedcapacity_mva'] = [float(parse_capacity(capacity)) for capacity in df_ltds['installedcapacity_mva']]
+    return df_ltds, aggregate_ltds(rows[SITE_KEY], capacities)
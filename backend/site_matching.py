@@ -0,0 +1,521 @@
+"""
+Indexed site matchers for grid_and_primary_calculated.py.
+
+The matchers build their lookup structures once per source table, so
+resolving a site no longer scans the whole table. Results (including which
+row wins when several match) are the same as the scan-based versions.
+"""
+
+import multiprocessing
+import re
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from match_cache import candidates_hash
+
+# Characters that make a str.contains() pattern more than a literal
+REGEX_METACHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+WORD_PATTERN = re.compile(r'\b[A-Z]+\b')
+NUMBER_PATTERN = re.compile(r'\b\d+\b')
+# Very common words skipped when picking a name's first meaningful word
+FIRST_WORD_SKIP = {'THE', 'A', 'AN'}
+# Words that never count as keywords for multi-keyword matching
+KEYWORD_STOPWORDS = {
+    'THE', 'AND', 'OR', 'OF', 'IN', 'AT', 'TO', 'FOR', 'WITH', 'BY', 'FROM', 'ON',
+    'MILL', 'HILL', 'ROAD', 'STREET', 'LANE', 'AVENUE', 'DRIVE', 'CLOSE', 'WAY',
+    'PRIMARY', 'SECONDARY', 'SUBSTATION', 'STATION', 'SUB', 'STN',
+    'KV', 'KILOVOLT', '33', '11', '132', '275', '400', '66', '22',
+}
+
+# A site name cleaned (stripped, upper-case) and tokenized once
+SiteName = namedtuple("SiteName", ["name", "clean", "words", "first_word", "other_words", "keywords", "numbers"])
+
+
+def normalize_site_location(site_loc):
+    """Normalize sitefunctionallocation for matching: no hyphens, stripped, upper-case"""
+    if pd.isna(site_loc):
+        return ""
+    return str(site_loc).replace("-", "").strip().upper()
+
+
+class SubstringIndex:
+    """Sorted suffixes of a set of texts: which texts contain a pattern, without scanning them all"""
+
+    def __init__(self, texts):
+        """texts: iterable of (position, text)"""
+        suffixes = sorted(
+            (text[start:], position)
+            for position, text in texts
+            for start in range(len(text) + 1)
+        )
+        self.suffixes = [suffix for suffix, _ in suffixes]
+        self.positions = [position for _, position in suffixes]
+
+    def containing(self, pattern):
+        """Sorted positions of the texts that contain `pattern`"""
+        found = set()
+        i = bisect_left(self.suffixes, pattern)
+        while i < len(self.suffixes) and self.suffixes[i].startswith(pattern):
+            found.add(self.positions[i])
+            i += 1
+        return sorted(found)
+
+    def first_containing(self, pattern):
+        found = self.containing(pattern)
+        return found[0] if found else None
+
+
+# Fewer queries than this are not worth starting worker processes for
+MIN_PARALLEL_QUERIES = 64
+# Chunks per worker: small enough to balance uneven queries, large enough to amortize pickling
+CHUNKS_PER_WORKER = 4
+
+# cached() result when no earlier run stored the key (None is a valid result)
+MISSING = object()
+
+# Function and items of the running parallel_map(), inherited by forked workers
+_parallel_function = None
+_parallel_items = None
+
+
+def _run_chunk(bounds):
+    start, end = bounds
+    return [_parallel_function(item) for item in _parallel_items[start:end]]
+
+
+def parallel_map(function, items, workers=1):
+    """
+    [function(item) for item in items], split into contiguous chunks over
+    `workers` forked processes. The workers inherit `function` (and whatever
+    index it is bound to) through fork instead of pickling it, and chunks are
+    merged in order, so the result does not depend on the worker count.
+    Runs serially for one worker, few items, or where fork is unavailable.
+    """
+    global _parallel_function, _parallel_items
+    items = list(items)
+    if workers <= 1 or len(items) < MIN_PARALLEL_QUERIES or 'fork' not in multiprocessing.get_all_start_methods():
+        return [function(item) for item in items]
+    chunk_size = -(-len(items) // (workers * CHUNKS_PER_WORKER))
+    chunks = [(start, min(start + chunk_size, len(items))) for start in range(0, len(items), chunk_size)]
+    _parallel_function, _parallel_items = function, items
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            return [result for chunk in executor.map(_run_chunk, chunks) for result in chunk]
+    finally:
+        _parallel_function = _parallel_items = None
+
+
+class CachedMatcher:
+    """
+    Memoizes results per normalized query, in memory and - when a
+    match_cache.MatchCache is given - across runs. Subclasses set NAME,
+    VERSION (bump it whenever the matching rules change), candidates_hash
+    and EMPTY (the result for missing input), implement query_key() and
+    compute(), and convert results to (match, score, method) records.
+    """
+
+    NAME = None
+    VERSION = 1
+    EMPTY = None
+
+    def __init__(self, match_cache=None):
+        self.match_cache = match_cache
+        self.memo = {}
+
+    def to_record(self, result):
+        return result
+
+    def from_record(self, match, score, method):
+        return match, score, method
+
+    def query_key(self, query):
+        """Normalized form of `query` results are cached under, None for missing input"""
+        raise NotImplementedError
+
+    def compute(self, query):
+        raise NotImplementedError
+
+    def cached(self, key):
+        """Result stored for `key` by an earlier run, or MISSING"""
+        record = self.match_cache.get(self, key) if self.match_cache is not None else None
+        return MISSING if record is None else self.from_record(*record)
+
+    def store(self, key, result):
+        self.memo[key] = result
+        if self.match_cache is not None:
+            self.match_cache.put(self, key, *self.to_record(result))
+
+    def match(self, query):
+        key = self.query_key(query)
+        if key is None:
+            return self.EMPTY
+        if key in self.memo:
+            return self.memo[key]
+        result = self.cached(key)
+        if result is not MISSING:
+            self.memo[key] = result
+            return result
+        result = self.compute(query)
+        self.store(key, result)
+        return result
+
+    def precompute(self, queries, workers=1):
+        """
+        Resolve `queries` up front so later match() calls are memo hits;
+        the ones no earlier run has cached are computed on `workers`
+        processes (see parallel_map).
+        """
+        pending = {}
+        for query in queries:
+            key = self.query_key(query)
+            if key is None or key in self.memo or key in pending:
+                continue
+            result = self.cached(key)
+            if result is not MISSING:
+                self.memo[key] = result
+            else:
+                pending[key] = query
+        results = parallel_map(self.compute, list(pending.values()), workers)
+        for key, result in zip(pending, results):
+            self.store(key, result)
+
+
+class LtdsMatcher(CachedMatcher):
+    """
+    Enhanced LTDS matching. Strategies, in order, each picking the first
+    LTDS row that satisfies it:
+    1. exact sitefunctionallocation
+    2. normalized sitefunctionallocation
+    3. LTDS location contains the site (str.contains: case-insensitive regex)
+    4. LTDS location contains the site (plain substring of str(location))
+    """
+
+    NAME = "ltds"
+
+    def __init__(self, ltds_df, match_cache=None):
+        super().__init__(match_cache)
+        self.locations = ltds_df['sitefunctionallocation'].tolist()
+        self.capacities = ltds_df['installedcapacity_mva'].tolist()
+        self.candidates_hash = candidates_hash(self.locations, self.capacities)
+        self.exact = {}
+        self.normalized = {}
+        for position, (location, normalized) in enumerate(zip(self.locations, ltds_df['sitefunctionallocation_normalized'])):
+            if isinstance(location, str):
+                self.exact.setdefault(location, position)
+            self.normalized.setdefault(normalized, position)
+
+        # Strategy 3 only sees string locations (str.contains gives NA for others).
+        # ASCII locations are indexed lower-cased; the rest are always re-checked.
+        self.string_positions = [p for p, location in enumerate(self.locations) if isinstance(location, str)]
+        self.lowered = SubstringIndex(
+            (p, self.locations[p].lower()) for p in self.string_positions if self.locations[p].isascii()
+        )
+        self.non_ascii_positions = [p for p in self.string_positions if not self.locations[p].isascii()]
+        self.literal = SubstringIndex(
+            (p, str(location)) for p, location in enumerate(self.locations) if pd.notna(location)
+        )
+
+    def partial_match(self, site_clean):
+        """First string location where the site, as a case-insensitive regex, is found"""
+        pattern = re.compile(site_clean, re.IGNORECASE)
+        if site_clean.isascii() and REGEX_METACHARACTERS.isdisjoint(site_clean):
+            # A plain ASCII pattern matches an ASCII location exactly when it is a
+            # substring of the lower-cased location
+            candidates = sorted(self.lowered.containing(site_clean.lower()) + self.non_ascii_positions)
+        else:
+            candidates = self.string_positions
+        for position in candidates:
+            if pattern.search(self.locations[position]):
+                return position
+        return None
+
+    def to_record(self, result):
+        return result, None, None
+
+    def from_record(self, match, score, method):
+        return match
+
+    def query_key(self, site_loc):
+        if pd.isna(site_loc) or site_loc == '':
+            return None
+        return str(site_loc)
+
+    def compute(self, site_loc):
+        """installedcapacity_mva of the matching LTDS row, or None"""
+        site_clean = str(site_loc).strip()
+        position = self.exact.get(site_clean)
+        if position is None:
+            position = self.normalized.get(normalize_site_location(site_loc))
+        if position is None:
+            position = self.partial_match(site_clean)
+        if position is None:
+            position = self.literal.first_containing(site_clean)
+        return None if position is None else self.capacities[position]
+
+
+class QuickRatioBounds:
+    """
+    SequenceMatcher(None, query, text).quick_ratio() of a query against many
+    texts at once. quick_ratio() is an upper bound of ratio(), so texts below
+    a similarity threshold can be skipped without running SequenceMatcher.
+    """
+
+    def __init__(self, texts):
+        self.alphabet = {char: j for j, char in enumerate(sorted({char for text in texts for char in text}))}
+        self.char_counts = np.zeros((len(texts), len(self.alphabet)), dtype=np.int32)
+        for i, text in enumerate(texts):
+            for char, count in Counter(text).items():
+                self.char_counts[i, self.alphabet[char]] = count
+        self.lengths = np.array([len(text) for text in texts], dtype=np.int64)
+
+    def bounds(self, query):
+        counts = np.zeros(len(self.alphabet), dtype=np.int32)
+        for char, count in Counter(query).items():
+            if char in self.alphabet:
+                counts[self.alphabet[char]] = count
+        matches = np.minimum(self.char_counts, counts).sum(axis=1)
+        total = self.lengths + len(query)
+        return np.where(total > 0, 2.0 * matches / np.maximum(total, 1), 1.0)
+
+
+def first_meaningful_word(words):
+    for word in words:
+        if len(word) >= 3 and word not in FIRST_WORD_SKIP:
+            return word
+    return None
+
+
+def tokenize_site_name(name, min_keyword_length=3):
+    clean = str(name).strip().upper()
+    words = WORD_PATTERN.findall(clean)
+    all_words = set(words)
+    return SiteName(
+        name=name,
+        clean=clean,
+        words=words,
+        first_word=first_meaningful_word(words),
+        other_words=set(words[1:]) if len(words) > 1 else set(),
+        keywords={word for word in all_words if len(word) >= min_keyword_length and word not in KEYWORD_STOPWORDS},
+        numbers=set(NUMBER_PATTERN.findall(clean)),
+    )
+
+
+class DnoaMatcher(CachedMatcher):
+    """
+    Fuzzy matching of DNOA substation titles to site names. Strategies,
+    scored per site name in list order (a later site replaces the best match
+    only with a strictly higher score):
+    1. Exact match (case insensitive) - returned immediately
+    2. First meaningful word match: 0.9, 0.95 when the site name starts with
+       it, +0.05 when another word is shared
+    3. Substring either way: length ratio * 0.7
+    4. At least 2 shared keywords: shared / max(keywords) * 0.6
+    5. Shared numbers with text similarity > 0.3:
+       shared / max(numbers) * 0.4 + similarity * 0.2
+    6. Text similarity > 0.8: similarity * 0.5
+    A match needs a final score above 0.1.
+
+    Site names are tokenized once and indexed by first word, keyword, number
+    and substring; only site names one of the strategies can score are
+    visited, and SequenceMatcher runs only where the quick_ratio() upper
+    bound can reach the similarity thresholds.
+    """
+
+    NAME = "dnoa"
+
+    def __init__(self, site_names, min_keyword_length=3, match_cache=None):
+        super().__init__(match_cache)
+        self.min_keyword_length = min_keyword_length
+        self.sites = [
+            tokenize_site_name(name, min_keyword_length)
+            for name in site_names
+            if not (pd.isna(name) or name == '')
+        ]
+        self.exact = {}
+        self.by_clean = {}
+        self.by_first_word = {}
+        self.by_keyword = {}
+        self.by_number = {}
+        for i, site in enumerate(self.sites):
+            self.exact.setdefault(site.clean, i)
+            self.by_clean.setdefault(site.clean, []).append(i)
+            if site.first_word:
+                self.by_first_word.setdefault(site.first_word, []).append(i)
+            for keyword in site.keywords:
+                self.by_keyword.setdefault(keyword, []).append(i)
+            for number in site.numbers:
+                self.by_number.setdefault(number, []).append(i)
+        self.substrings = SubstringIndex((i, site.clean) for i, site in enumerate(self.sites))
+        self.quick_ratios = QuickRatioBounds([site.clean for site in self.sites])
+        self.candidates_hash = candidates_hash([site.name for site in self.sites], [min_keyword_length])
+
+    def candidates(self, dnoa):
+        """Site names at least one of strategies 2-6 can score"""
+        found = set()
+        if dnoa.first_word:
+            found.update(self.by_first_word.get(dnoa.first_word, ()))
+        if dnoa.clean:
+            found.update(self.substrings.containing(dnoa.clean))
+            length = len(dnoa.clean)
+            for start in range(length):
+                for end in range(start + 1, length + 1):
+                    found.update(self.by_clean.get(dnoa.clean[start:end], ()))
+        shared_keywords = Counter(i for keyword in dnoa.keywords for i in self.by_keyword.get(keyword, ()))
+        found.update(i for i, count in shared_keywords.items() if count >= 2)
+        bounds = self.quick_ratios.bounds(dnoa.clean)
+        for number in dnoa.numbers:
+            found.update(i for i in self.by_number.get(number, ()) if bounds[i] > 0.3)
+        found.update(np.flatnonzero(bounds > 0.8).tolist())
+        return sorted(found), bounds
+
+    EMPTY = (None, 0, 'no_input')
+
+    def query_key(self, dnoa_site):
+        if pd.isna(dnoa_site) or dnoa_site == '':
+            return None
+        return str(dnoa_site).strip().upper()
+
+    def compute(self, dnoa_site):
+        """(site name, score, method) of the best match, or (None, 0, reason)"""
+        return self.score(tokenize_site_name(dnoa_site, self.min_keyword_length))
+
+    def score(self, dnoa):
+        if dnoa.clean in self.exact:
+            return self.sites[self.exact[dnoa.clean]].name, 1.0, 'exact_match'
+
+        best_match = None
+        best_score = 0
+        match_method = None
+        positions, bounds = self.candidates(dnoa)
+        for i in positions:
+            site = self.sites[i]
+            similarity = None
+
+            if dnoa.first_word and site.first_word == dnoa.first_word:
+                first_word_score = 0.95 if site.clean.startswith(site.first_word) else 0.9
+                if dnoa.other_words and site.other_words and dnoa.other_words & site.other_words:
+                    first_word_score += 0.05
+                if first_word_score > best_score:
+                    best_match, best_score, match_method = site.name, first_word_score, f'first_word_match_{dnoa.first_word}'
+
+            if dnoa.clean in site.clean:
+                score = len(dnoa.clean) / len(site.clean) * 0.7
+                if score > best_score:
+                    best_match, best_score, match_method = site.name, score, 'substring_dnoa_in_final'
+            elif site.clean in dnoa.clean:
+                score = len(site.clean) / len(dnoa.clean) * 0.7
+                if score > best_score:
+                    best_match, best_score, match_method = site.name, score, 'substring_final_in_dnoa'
+
+            if dnoa.keywords and site.keywords:
+                matching_keywords = dnoa.keywords & site.keywords
+                if len(matching_keywords) >= 2:
+                    keyword_score = len(matching_keywords) / max(len(dnoa.keywords), len(site.keywords))
+                    keyword_score *= 0.6
+                    if keyword_score > best_score:
+                        best_match, best_score, match_method = site.name, keyword_score, f'multi_keyword_match_{list(matching_keywords)}'
+
+            if dnoa.numbers and site.numbers:
+                matching_numbers = dnoa.numbers & site.numbers
+                if matching_numbers and bounds[i] > 0.3:
+                    similarity = SequenceMatcher(None, dnoa.clean, site.clean).ratio()
+                    if similarity > 0.3:
+                        number_score = (len(matching_numbers) / max(len(dnoa.numbers), len(site.numbers))) * 0.4 + similarity * 0.2
+                        if number_score > best_score:
+                            best_match, best_score, match_method = site.name, number_score, f'number_text_match_{list(matching_numbers)}'
+
+            if bounds[i] > 0.8:
+                if similarity is None:
+                    similarity = SequenceMatcher(None, dnoa.clean, site.clean).ratio()
+                if similarity > 0.8 and similarity > best_score:
+                    best_match, best_score, match_method = site.name, similarity * 0.5, 'fuzzy_high_threshold'
+
+        if best_match and best_score > 0.1:
+            return best_match, best_score, match_method
+        return None, 0, 'no_match'
+
+
+class GspMatcher(CachedMatcher):
+    """
+    Fuzzy matching of Grid Supply Point names against a candidate list, in
+    list order:
+    1. Exact match (case insensitive): the first one wins, score 1.0
+    2. One name contains the other: score max(length ratio, inverse) > 1,
+       the first candidate with the highest score wins
+    3. Otherwise SequenceMatcher similarity >= threshold: the first
+       candidate with the highest similarity wins
+
+    Candidates are deduplicated and normalized once, similarity is only
+    computed where the quick_ratio() bound can reach the threshold and beat
+    the best so far, and results are memoized per normalized name.
+    """
+
+    NAME = "gsp"
+
+    def __init__(self, candidates, threshold=0.6, match_cache=None):
+        super().__init__(match_cache)
+        self.threshold = threshold
+        self.candidates = []
+        self.cleans = []
+        seen = set()
+        for candidate in candidates:
+            if pd.isna(candidate) or candidate == '' or candidate in seen:
+                continue
+            seen.add(candidate)
+            clean = str(candidate).strip().upper()
+            if not clean:
+                continue
+            self.candidates.append(candidate)
+            self.cleans.append(clean)
+        self.exact = {}
+        for candidate, clean in zip(self.candidates, self.cleans):
+            self.exact.setdefault(clean, candidate)
+        self.quick_ratios = QuickRatioBounds(self.cleans)
+        self.candidates_hash = candidates_hash(self.candidates, [threshold])
+
+    EMPTY = (None, 0)
+
+    def query_key(self, name):
+        if pd.isna(name) or name == '':
+            return None
+        return str(name).strip().upper()
+
+    def compute(self, name):
+        """(best candidate, score) or (None, 0) if no good match"""
+        return self.score(self.query_key(name))
+
+    def to_record(self, result):
+        return result[0], result[1], None
+
+    def from_record(self, match, score, method):
+        return match, score
+
+    def score(self, clean):
+        if clean in self.exact:
+            return self.exact[clean], 1.0
+
+        # Containment scores are > 1, so they beat any similarity
+        best_match = None
+        best_score = 0
+        for candidate, candidate_clean in zip(self.candidates, self.cleans):
+            if candidate_clean in clean or clean in candidate_clean:
+                score = max(len(candidate_clean) / len(clean), len(clean) / len(candidate_clean))
+                if score > best_score:
+                    best_match, best_score = candidate, score
+        if best_match is not None:
+            return best_match, best_score
+
+        bounds = self.quick_ratios.bounds(clean)
+        for i in np.flatnonzero(bounds >= self.threshold).tolist():
+            if bounds[i] <= best_score:
+                continue
+            similarity = SequenceMatcher(None, clean, self.cleans[i]).ratio()
+            if similarity > best_score and similarity >= self.threshold:
+                best_match, best_score = self.candidates[i], similarity
+        return best_match, best_score
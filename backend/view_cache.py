@@ -0,0 +1,63 @@
+"""
+Materialized saved-view results.
+
+The encoded /api/views/{view_name}/data and /map responses are kept per
+(user_id, view_name, definition hash, data version, kind), so re-opening a
+view is a dictionary lookup. Saving a view drops its entries; publishing a
+new dataset version drops every entry of older versions (and entries for an
+old version can never be hit anyway, since the version is part of the key).
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+VIEW_CACHE_SIZE = int(os.getenv("VIEW_CACHE_SIZE", 256))
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def definition_hash(selected_columns):
+    """Short fingerprint of a view definition (its stored column list)"""
+    return hashlib.sha1((selected_columns or "").encode("utf-8")).hexdigest()[:12]
+
+
+def get_or_build(user_id, view_name, selected_columns, version, kind, build):
+    """Return the cached payload for a view, materializing it with `build()` on a miss"""
+    key = (user_id, view_name, definition_hash(selected_columns), version, kind)
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            stats["hits"] += 1
+            return _entries[key]
+        stats["misses"] += 1
+    payload = build()
+    with _lock:
+        _entries[key] = payload
+        while len(_entries) > VIEW_CACHE_SIZE:
+            _entries.popitem(last=False)
+    return payload
+
+
+def invalidate_view(user_id, view_name):
+    """Drop every materialized result of one view (after it is saved)"""
+    with _lock:
+        for key in [key for key in _entries if key[0] == user_id and key[1] == view_name]:
+            del _entries[key]
+        stats["invalidations"] += 1
+
+
+def retain_version(version):
+    """Drop results materialized for any other dataset version (after a publish)"""
+    with _lock:
+        for key in [key for key in _entries if key[3] != version]:
+            del _entries[key]
+        stats["invalidations"] += 1
+
+
+def status():
+    with _lock:
+        return dict(stats, entries=len(_entries), capacity=VIEW_CACHE_SIZE)
@@ -0,0 +1,192 @@
+"""
+Data-access layer for the saved-views database (user_views.db).
+
+Connections are pooled per thread, opened on an absolute path (the API no
+longer depends on the process working directory) and configured for WAL so
+readers never block behind a save. Statements are module-level constants, so
+sqlite3's per-connection statement cache reuses the prepared statements.
+Writes are single-statement UPSERTs backed by unique indexes on
+(user_id, slot) and (user_id, view_name).
+"""
+
+import os
+import sqlite3
+import threading
+
+DB_PATH = os.getenv("USER_VIEWS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "user_views.db"))
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+]
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS user_views (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        slot INTEGER NOT NULL CHECK (slot >= 1 AND slot <= 5),
+        name TEXT,
+        selected_columns TEXT NOT NULL,
+        chart_config TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        filters TEXT,
+        UNIQUE(user_id, slot)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS saved_views (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        view_name TEXT NOT NULL,
+        selected_columns TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+# user_views is already backed by its UNIQUE(user_id, slot) constraint.
+# Databases created before idx_saved_views_user_name may hold duplicate
+# (user_id, view_name) rows; the newest one is kept when the index is added
+SAVED_VIEWS_INDEX_EXISTS = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_saved_views_user_name'"
+
+DEDUPE_SAVED_VIEWS = """
+    DELETE FROM saved_views WHERE id NOT IN (
+        SELECT MAX(id) FROM saved_views GROUP BY user_id, view_name
+    )
+"""
+
+CREATE_SAVED_VIEWS_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_saved_views_user_name ON saved_views (user_id, view_name)"
+
+LIST_USER_VIEWS = """
+    SELECT id, slot, name, selected_columns, chart_config, filters, created_at, updated_at
+    FROM user_views
+    WHERE user_id = ?
+    ORDER BY slot
+"""
+
+GET_USER_VIEW = """
+    SELECT id, slot, name, selected_columns, chart_config, filters, created_at, updated_at
+    FROM user_views
+    WHERE user_id = ? AND slot = ?
+"""
+
+UPSERT_USER_VIEW = """
+    INSERT INTO user_views (user_id, slot, name, selected_columns, chart_config, filters)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, slot) DO UPDATE SET
+        name = excluded.name,
+        selected_columns = excluded.selected_columns,
+        chart_config = excluded.chart_config,
+        filters = excluded.filters,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+DELETE_USER_VIEW = "DELETE FROM user_views WHERE user_id = ? AND slot = ?"
+
+LIST_SAVED_VIEWS = """
+    SELECT view_name, selected_columns, created_at FROM saved_views
+    WHERE user_id = ?
+    ORDER BY view_name
+"""
+
+GET_SAVED_VIEW = """
+    SELECT view_name, selected_columns, created_at FROM saved_views
+    WHERE user_id = ? AND view_name = ?
+"""
+
+UPSERT_SAVED_VIEW = """
+    INSERT INTO saved_views (user_id, view_name, selected_columns)
+    VALUES (?, ?, ?)
+    ON CONFLICT (user_id, view_name) DO UPDATE SET
+        selected_columns = excluded.selected_columns,
+        created_at = CURRENT_TIMESTAMP
+"""
+
+ALL_SAVED_VIEWS = "SELECT user_id, view_name, selected_columns FROM saved_views"
+
+_local = threading.local()
+_connections = []
+_pool_lock = threading.Lock()
+_schema_ready = False
+
+
+def create_schema(conn):
+    """Create the tables, adding the saved_views unique index (once) if it is missing"""
+    with conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        if conn.execute(SAVED_VIEWS_INDEX_EXISTS).fetchone() is None:
+            removed = conn.execute(DEDUPE_SAVED_VIEWS).rowcount
+            conn.execute(CREATE_SAVED_VIEWS_INDEX)
+            print(f"Added idx_saved_views_user_name; removed {removed} duplicate saved_views rows")
+
+
+def get_connection():
+    """Return this thread's connection, opening and configuring it on first use"""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=64)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    with _pool_lock:
+        if not _schema_ready:
+            create_schema(conn)
+            _schema_ready = True
+        _connections.append(conn)
+    _local.conn = conn
+    return conn
+
+
+def close_all():
+    """Close every pooled connection (on application shutdown)"""
+    with _pool_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.clear()
+
+
+def list_user_views(user_id):
+    return get_connection().execute(LIST_USER_VIEWS, (user_id,)).fetchall()
+
+
+def get_user_view(user_id, slot):
+    return get_connection().execute(GET_USER_VIEW, (user_id, slot)).fetchone()
+
+
+def upsert_user_view(user_id, slot, name, selected_columns, chart_config, filters):
+    conn = get_connection()
+    with conn:
+        conn.execute(UPSERT_USER_VIEW, (user_id, slot, name, selected_columns, chart_config, filters))
+
+
+def delete_user_view(user_id, slot):
+    conn = get_connection()
+    with conn:
+        conn.execute(DELETE_USER_VIEW, (user_id, slot))
+
+
+def list_saved_views(user_id):
+    return get_connection().execute(LIST_SAVED_VIEWS, (user_id,)).fetchall()
+
+
+def get_saved_view(user_id, view_name):
+    return get_connection().execute(GET_SAVED_VIEW, (user_id, view_name)).fetchone()
+
+
+def upsert_saved_view(user_id, view_name, selected_columns):
+    conn = get_connection()
+    with conn:
+        conn.execute(UPSERT_SAVED_VIEW, (user_id, view_name, selected_columns))
+
+
+def all_saved_views():
+    return get_connection().execute(ALL_SAVED_VIEWS).fetchall()
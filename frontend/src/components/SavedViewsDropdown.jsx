@@ -15,6 +15,7 @@ const SavedViewsDropdown = ({ onLoadView }) => {
     try {
       setLoading(true);
       setError("");
+      // The listing returns every view definition for the user
       const response = await fetch(`${API_BASE}/api/user/views`);
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
@@ -57,18 +58,8 @@ const SavedViewsDropdown = ({ onLoadView }) => {
       setLoading(true);
       setIsOpen(false);
 
-      const response = await fetch(`${API_BASE}/api/user/views/${view.slot}`);
-
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-
-      const data = await response.json();
-
-      if (data.error) {
-        setError(data.error);
-        return;
-      }
+      // The listing already holds the full definition, no per-slot request needed
+      const data = view;
 
       // Apply the loaded view configuration
       const viewConfig = {
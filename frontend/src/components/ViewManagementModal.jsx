@@ -104,13 +104,18 @@ const ViewManagementModal = ({
 
     try {
       setLoading(true);
-      const response = await fetch(
-        `${API_BASE}/api/user/views/${selectedSlot}`
-      );
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
+      // The listing already holds every saved definition, so switching views
+      // needs no round trip; only fall back to the server for unlisted slots
+      let data = views.find((view) => view.slot === parseInt(selectedSlot));
+      if (!data) {
+        const response = await fetch(
+          `${API_BASE}/api/user/views/${selectedSlot}`
+        );
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        data = await response.json();
       }
-      const data = await response.json();
 
       if (data.error) {
         setError(data.error);
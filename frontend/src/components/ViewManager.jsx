@@ -47,6 +47,7 @@ const ViewManager = ({
   const fetchViews = async () => {
     try {
       setLoading(true);
+      // The listing returns every view definition for the user
       const response = await axios.get("http://localhost:8000/api/user/views");
       setViews(response.data.views || []);
       setLoading(false);
@@ -65,9 +66,15 @@ const ViewManager = ({
 
     try {
       setLoading(true);
-      const response = await axios.get(
-        `http://localhost:8000/api/user/views/${selectedSlot}`
+      // Use the listed definition; only unlisted slots hit the server
+      const listedView = views.find(
+        (view) => view.slot === parseInt(selectedSlot)
       );
+      const response = listedView
+        ? { data: listedView }
+        : await axios.get(
+            `http://localhost:8000/api/user/views/${selectedSlot}`
+          );
 
       if (response.data.error) {
         setError(response.data.error);
@@ -0,0 +1,293 @@
+"""
+Regression test for backend/capacity_engine.py: transformer_capacity must
+give exactly the same frame as the row-wise process_row it replaced.
+
+process_row and its helpers below are copied unchanged from the original
+grid_and_primary_calculated.py (it cannot be imported: the script connects
+to the database on import).
+
+Run with: python -m pytest test_capacity_engine.py
+"""
+
+import os
+import random
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from capacity_engine import transformer_capacity  # noqa: E402
+
+SPARE_MULTIPLIER = 0.96
+
+column_tracking = {'calculated_columns': {}}
+
+
+def track_calculated_column(column_name, description, formula=None):
+    column_tracking['calculated_columns'][column_name] = {'description': description, 'formula': formula}
+
+
+# ============================================================================
+# BASELINE ROW-WISE IMPLEMENTATION
+# ============================================================================
+
+def parse_demand_value(demand_str):
+    """Parse demand value - handle both single values and comma-separated values"""
+    if pd.isna(demand_str) or demand_str == '' or demand_str is None:
+        return 0.0
+    demand_str = str(demand_str).strip()
+    if ',' in demand_str:
+        values = [float(x.strip()) for x in demand_str.split(",") if x.strip().replace('.', '', 1).replace('-', '', 1).isdigit()]
+        return sum(values) if values else 0.0
+    else:
+        return float(demand_str) if demand_str.replace('.', '', 1).replace('-', '', 1).isdigit() else 0.0
+
+def calculate_generation_capacity(row, transformer_ratings, season='summer'):
+    """
+    Calculate generation capacity based on reversepower and transformer ratings
+    
+    NEW FORMULA:
+    - If reversepower = "100%": return 1st transformer rating
+    - If reversepower = "<100%": return 1st transformer rating / 2  
+    - If reversepower = "X MVA": return X (the MVA value)
+    - If reversepower = "X MVA, Y MVA, Z MVA": return MIN(X, Y, Z)
+    """
+    value = row.get('reversepower')
+    if pd.isna(value) or value == '' or value is None:
+        return 0.0, False
+    
+    # Get first transformer rating (index 0)
+    first_transformer = transformer_ratings[0] if len(transformer_ratings) > 0 else 0.0
+    
+    value_str = str(value).strip().lower()
+    
+    # Case 1: reversepower = "100%" -> return 1st transformer rating
+    if value_str == '100%':
+        return first_transformer, False
+    
+    # Case 2: reversepower = "<100%" -> return 1st transformer rating / 2
+    if '<' in value_str and '%' in value_str:
+        return first_transformer / 2, False
+    
+    # Case 3: reversepower contains MVA values
+    if 'mva' in value_str:
+        # Find all MVA values in the string
+        mva_matches = re.findall(r'([\d.]+)\s*mva', value_str)
+        if mva_matches:
+            try:
+                mva_values = [float(match) for match in mva_matches]
+                # If multiple MVA values, return the minimum
+                return min(mva_values), True
+            except ValueError:
+                return 0.0, False
+    
+    # Case 4: Other percentage values -> return 1st transformer × (percentage/100)
+    if '%' in value_str:
+        try:
+            percent_match = re.search(r'([\d.]+)\s*%', value_str)
+            if percent_match:
+                percent_value = float(percent_match.group(1))
+                return first_transformer * (percent_value / 100), False
+        except ValueError:
+            return 0.0, False
+    
+    return 0.0, False
+
+def process_row(row):
+    count = int(row["powertransformercount"])
+    
+    # Helper function to safely convert to numeric and handle NULL
+    def safe_numeric_convert(value_str):
+        """Convert string values to numeric, return None for invalid/empty values"""
+        if pd.isna(value_str) or str(value_str).strip() == '' or str(value_str).strip().lower() == 'null':
+            return None
+        try:
+            return float(str(value_str).strip())
+        except (ValueError, TypeError):
+            return None
+    
+    # Summer - convert all values to numeric with proper NULL handling
+    summer_ratings_raw = str(row["transratingsummer"]).split(",") if not pd.isna(row["transratingsummer"]) else []
+    summer_ratings = [safe_numeric_convert(x.strip()) for x in summer_ratings_raw]
+    # Remove None values for calculation but keep track of original positions
+    summer_ratings_valid = [x for x in summer_ratings if x is not None]
+    limited_summer = summer_ratings_valid[:count]
+    
+    # Fill individual transformer columns - use NULL for missing ratings
+    for i in range(count):
+        trans_col = f'Trans{i+1}_Summer'
+        if i < len(summer_ratings) and summer_ratings[i] is not None:
+            row[trans_col] = summer_ratings[i]
+        else:
+            row[trans_col] = None  # Use NULL for empty/missing ratings
+        # Track individual transformer columns (only track once)
+        if trans_col not in column_tracking['calculated_columns']:
+            track_calculated_column(trans_col, f'Summer rating for transformer {i+1}', f'Extracted from transratingsummer column, position {i+1}, NULL if missing')
+    
+    summer_demand = parse_demand_value(row.get('maxdemandsummer', 0))
+    
+    # Modified spare calculation for single rating scenario
+    if len(limited_summer) == 1:
+        # Single rating: use (alone rating - max_demand) * SPARE_MULTIPLIER
+        row['Spare_Summer'] = round((limited_summer[0] - summer_demand) * SPARE_MULTIPLIER, 2)
+    else:
+        # Traditional formula for multiple ratings
+        row['Spare_Summer'] = round(((sum(limited_summer) - max(limited_summer, default=0)) - summer_demand) * SPARE_MULTIPLIER, 2)
+    
+    # Calculate summer generation capacity using summer transformer ratings
+    gen_capacity_summer, _ = calculate_generation_capacity(row, limited_summer, season='summer')
+    
+    # Winter - convert all values to numeric with proper NULL handling
+    winter_ratings_raw = str(row["transratingwinter"]).split(",") if not pd.isna(row["transratingwinter"]) else []
+    winter_ratings = [safe_numeric_convert(x.strip()) for x in winter_ratings_raw]
+    # Remove None values for calculation but keep track of original positions
+    winter_ratings_valid = [x for x in winter_ratings if x is not None]
+    limited_winter = winter_ratings_valid[:count]
+    
+    # Fill individual transformer columns - use NULL for missing ratings
+    for i in range(count):
+        trans_col = f'Trans{i+1}_Winter'
+        if i < len(winter_ratings) and winter_ratings[i] is not None:
+            row[trans_col] = winter_ratings[i]
+        else:
+            row[trans_col] = None  # Use NULL for empty/missing ratings
+        # Track individual transformer columns (only track once)
+        if trans_col not in column_tracking['calculated_columns']:
+            track_calculated_column(trans_col, f'Winter rating for transformer {i+1}', f'Extracted from transratingwinter column, position {i+1}, NULL if missing')
+    
+    winter_demand = parse_demand_value(row.get('maxdemandwinter', 0))
+    
+    # Modified spare calculation for single rating scenario
+    if len(limited_winter) == 1:
+        # Single rating: use (alone rating - max_demand) * SPARE_MULTIPLIER
+        row['Spare_Winter'] = round((limited_winter[0] - winter_demand) * SPARE_MULTIPLIER, 2)
+    else:
+        # Traditional formula for multiple ratings
+        row['Spare_Winter'] = round(((sum(limited_winter) - max(limited_winter, default=0)) - winter_demand) * SPARE_MULTIPLIER, 2)
+    
+    # Calculate winter generation capacity using winter transformer ratings
+    gen_capacity_winter, _ = calculate_generation_capacity(row, limited_winter, season='winter')
+    
+    # Generation Capacity - take min of summer and winter (removed DIMINIMUS_ADDITION)
+    row['Generation_Capacity'] = min(gen_capacity_summer, gen_capacity_winter)
+    
+    # ============================================================================
+    # FIRM CAPACITY CALCULATION
+    # ============================================================================
+    
+    # Calculate Firm Capacity based on different scenarios
+    
+    # Scenario 1: Both summer and winter have multiple ratings
+    if len(limited_summer) > 1 and len(limited_winter) > 1:
+        firm_summer = ((sum(limited_summer) - max(limited_summer, default=0)) * SPARE_MULTIPLIER)
+        firm_winter = ((sum(limited_winter) - max(limited_winter, default=0)) * SPARE_MULTIPLIER)
+        row['Firm_Capacity'] = round(min(firm_summer, firm_winter), 2)
+    
+    # Scenario 2: Both summer and winter have single ratings
+    elif len(limited_summer) == 1 and len(limited_winter) == 1:
+        firm_summer = limited_summer[0] * SPARE_MULTIPLIER
+        firm_winter = limited_winter[0] * SPARE_MULTIPLIER
+        row['Firm_Capacity'] = round(min(firm_summer, firm_winter), 2)
+    
+    # Scenario 3a: Summer multiple, Winter single
+    elif len(limited_summer) > 1 and len(limited_winter) == 1:
+        firm_summer = ((sum(limited_summer) - max(limited_summer, default=0)) * SPARE_MULTIPLIER)
+        firm_winter = limited_winter[0] * SPARE_MULTIPLIER
+        row['Firm_Capacity'] = round(min(firm_summer, firm_winter), 2)
+    
+    # Scenario 3b: Summer single, Winter multiple
+    elif len(limited_summer) == 1 and len(limited_winter) > 1:
+        firm_summer = limited_summer[0] * SPARE_MULTIPLIER
+        firm_winter = ((sum(limited_winter) - max(limited_winter, default=0)) * SPARE_MULTIPLIER)
+        row['Firm_Capacity'] = round(min(firm_summer, firm_winter), 2)
+    
+    # Edge case: No valid ratings (shouldn't happen with filtering, but safety check)
+    else:
+        row['Firm_Capacity'] = 0.0
+    
+    return row
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+RATING_TOKENS = ['10', '12.5', ' 7 ', '', 'null', 'NULL', 'abc', 'nan', 'inf', '-inf', '1e2', '-0.0', '0',
+                 '15.0', '  ', '3.333333333', '0.1', '0.2', '0.3', '1e308', '-5', '2.5.1']
+DEMANDS = [None, np.nan, '', '5', '5.5', '-3', '1,2', '1.5, 2.5', 'x', '1,x', '3.3,,4', '--1', '1.2.3', 7.0, 0,
+           '0.1,0.2', ' 4 ', '1e3', '-0', '.5', '5.', '-.5', ' 1 , 2 ,', 1e20, -2.5, '0.1,0.2,0.3', '1e308,1e308', ',']
+REVERSEPOWERS = [None, np.nan, '', '100%', '<100%', '< 100 %', '50%', '12.5 %', '10 MVA', '10MVA, 5 MVA, 7.5 mva',
+                 'MVA', '1.2.3 MVA', 'abc', '75%,', '.%', '1..2%', '30 mva 20%', '100 %', 'x% 20%', '<50%', '0%',
+                 'inf%', ' 100% ', '5 MVA 1..2 mva', '1e5%', 3.0, 100, '1.5MVA,2MVA']
+
+
+def random_ratings(rng):
+    if rng.random() < 0.1:
+        return rng.choice([None, np.nan, 12.0])
+    return ','.join(rng.choice(RATING_TOKENS) for _ in range(rng.randint(1, 5)))
+
+
+def random_sites(rng, n):
+    return pd.DataFrame({
+        'sitefunctionallocation': [f'S{i}' for i in range(n)],
+        'powertransformercount': [rng.choice([0, 1, 2, 2, 3, 4, -1]) for _ in range(n)],
+        'transratingsummer': [random_ratings(rng) for _ in range(n)],
+        'transratingwinter': [random_ratings(rng) for _ in range(n)],
+        'maxdemandsummer': [rng.choice(DEMANDS) for _ in range(n)],
+        'maxdemandwinter': [rng.choice(DEMANDS) for _ in range(n)],
+        'reversepower': [rng.choice(REVERSEPOWERS) for _ in range(n)],
+        'other': [rng.random() for _ in range(n)],
+    })
+
+
+def assert_matches_baseline(df):
+    column_tracking['calculated_columns'].clear()
+    expected = df.apply(process_row, axis=1)
+    result, trans_columns = transformer_capacity(df, SPARE_MULTIPLIER)
+    pd.testing.assert_frame_equal(result, expected, check_exact=True)
+    # TransN columns are registered in the order process_row first tracked them
+    assert [name for name, _, _ in trans_columns] == list(column_tracking['calculated_columns'])
+
+
+def test_randomized_sites():
+    for seed in range(100):
+        rng = random.Random(seed)
+        assert_matches_baseline(random_sites(rng, rng.randint(1, 40)))
+
+
+def test_edge_cases():
+    rows = [
+        # count, summer, winter, demand summer, demand winter, reversepower
+        (1, '30', '32', '10', '12', '100%'),                    # single rating
+        (2, '30,30', '32,32', '10,5', '12', '<100%'),           # multiple ratings, comma demand
+        (3, '30,,abc,40', '32', '', None, '10 MVA, 5 MVA'),     # invalid tokens dropped before truncating
+        (2, '0.1,0.2,0.3', '0.1,0.2', '0.3', '0', '33.3%'),     # float rounding
+        (0, '30,40', '30,40', '10', '10', '100%'),              # no transformers
+        (-1, '30,40,50', '30', '10', '10', '50%'),              # negative count slices from the end
+        (2, 'nan,20', '20,nan', '5', '5', '100%'),              # NaN ratings in max()/min()
+        (2, 'inf,-inf', '1e308,1e308', '1e308,1e308', '-inf', '100%'),
+        (4, None, np.nan, np.nan, None, None),                  # missing rating lists
+        (1, 'null', 'NULL', 'x', '--1', 'abc'),                 # nothing parseable
+    ]
+    df = pd.DataFrame(rows, columns=['powertransformercount', 'transratingsummer', 'transratingwinter',
+                                     'maxdemandsummer', 'maxdemandwinter', 'reversepower'])
+    assert_matches_baseline(df)
+    for i in range(len(df)):
+        assert_matches_baseline(df.iloc[[i]].reset_index(drop=True))
+
+
+def test_uniform_counts():
+    rng = random.Random(7)
+    df = random_sites(rng, 300)
+    df['powertransformercount'] = 2
+    assert_matches_baseline(df)
+
+
+if __name__ == "__main__":
+    test_randomized_sites()
+    test_edge_cases()
+    test_uniform_counts()
+    print("transformer_capacity matches the row-wise baseline")
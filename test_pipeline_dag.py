@@ -0,0 +1,157 @@
+"""
+Tests for backend/pipeline_dag.py: stage selection, checkpoint reuse,
+--from/--to runs and replay of the column-tracking state.
+
+Run with: python -m pytest test_pipeline_dag.py
+"""
+
+import os
+import sys
+import tempfile
+from collections import Counter
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from pipeline_dag import CheckpointMissing, PipelineStage, run_stages, select_stages  # noqa: E402
+
+
+def make_stages(source, calls, state):
+    """fetch -> double -> label -> finalize, counting how often each stage runs"""
+    def run_fetch():
+        calls['fetch'] += 1
+        return {'raw': source['raw'].copy()}
+
+    def run_double(raw):
+        calls['double'] += 1
+        state.setdefault('calculated_columns', {})['value'] = 'value * 2'
+        return {'doubled': raw.assign(value=raw['value'] * 2)}
+
+    def run_label(doubled):
+        calls['label'] += 1
+        state.setdefault('calculated_columns', {})['label'] = 'row <value> above 2'
+        return {'labelled': doubled.assign(
+            # str/None stays Parquet-safe, mixed types and NaN force a pickle
+            label=[f'row {v}' if v > 2 else None for v in doubled['value']],
+            mixed=[1, 'a', None, float('nan')][:len(doubled)],
+        )}
+
+    def run_finalize(labelled):
+        calls['finalize'] += 1
+        return {'output': labelled.copy()}
+
+    return [
+        PipelineStage('fetch', (), ('raw',), run_fetch, always_run=True),
+        PipelineStage('double', ('raw',), ('doubled',), run_double),
+        PipelineStage('label', ('doubled',), ('labelled',), run_label),
+        PipelineStage('finalize', ('labelled',), ('output',), run_finalize, always_run=True),
+    ]
+
+
+class Pipeline:
+    def __init__(self, checkpoint_dir, values=(1, 2, 3, 4)):
+        self.checkpoint_dir = checkpoint_dir
+        self.source = {'raw': pd.DataFrame({'value': list(values)})}
+        self.calls = Counter()
+        self.state = {}
+
+    def run(self, params=None, start=None, stop=None):
+        self.calls.clear()
+        self.state = {}
+        stages = make_stages(self.source, self.calls, self.state)
+        return run_stages(stages, params or {'multiplier': 2}, self.state,
+                          checkpoint_dir=self.checkpoint_dir, start=start, stop=stop)
+
+
+def test_select_stages():
+    stages = make_stages({}, Counter(), {})
+    selected, downstream = select_stages(stages)
+    assert [stage.name for stage in selected] == ['fetch', 'double', 'label', 'finalize']
+    selected, downstream = select_stages(stages, stop='double')
+    assert [stage.name for stage in selected] == ['fetch', 'double']
+    selected, downstream = select_stages(stages, start='label')
+    assert downstream == {'label', 'finalize'}
+    for kwargs in ({'start': 'nope'}, {'stop': 'nope'}):
+        try:
+            select_stages(stages, **kwargs)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"select_stages accepted {kwargs}")
+    try:
+        select_stages(stages[1:])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("select_stages accepted an input no stage produces")
+
+
+def test_unchanged_inputs_reuse_checkpoints():
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        pipeline = Pipeline(checkpoint_dir)
+        first = pipeline.run()
+        first_state = pipeline.state
+        assert pipeline.calls == Counter(fetch=1, double=1, label=1, finalize=1)
+
+        second = pipeline.run()
+        # The fetch stage returned the same data, so everything after it is reused
+        assert pipeline.calls == Counter(fetch=1, finalize=1)
+        pd.testing.assert_frame_equal(second['output'], first['output'], check_exact=True)
+        assert second['output']['mixed'].map(type).tolist() == first['output']['mixed'].map(type).tolist()
+        # The reused stages' state changes are replayed
+        assert pipeline.state == first_state
+
+
+def test_changes_rerun_downstream_stages():
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        pipeline = Pipeline(checkpoint_dir)
+        pipeline.run()
+
+        pipeline.source['raw'] = pd.DataFrame({'value': [1, 2, 3, 5]})
+        result = pipeline.run()
+        assert pipeline.calls == Counter(fetch=1, double=1, label=1, finalize=1)
+        assert result['output']['value'].tolist() == [2, 4, 6, 10]
+
+        pipeline.run(params={'multiplier': 3})
+        assert pipeline.calls == Counter(fetch=1, double=1, label=1, finalize=1)
+
+
+def test_start_and_stop():
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        pipeline = Pipeline(checkpoint_dir)
+        try:
+            pipeline.run(start='label')
+        except CheckpointMissing:
+            pass
+        else:
+            raise AssertionError("run_stages(start=...) ran without checkpoints")
+
+        full = pipeline.run()
+        full_state = pipeline.state
+        # --from label: earlier stages (even fetch) are loaded from their checkpoints
+        pipeline.source['raw'] = pd.DataFrame({'value': [7, 7, 7, 7]})
+        result = pipeline.run(start='label')
+        assert pipeline.calls == Counter(label=1, finalize=1)
+        pd.testing.assert_frame_equal(result['output'], full['output'], check_exact=True)
+        assert pipeline.state == full_state
+
+        result = pipeline.run(stop='double')
+        assert pipeline.calls == Counter(fetch=1, double=1)
+        assert set(result) == {'raw', 'doubled'}
+
+
+def test_checkpoints_disabled():
+    pipeline = Pipeline('')
+    pipeline.run()
+    pipeline.run()
+    assert pipeline.calls == Counter(fetch=1, double=1, label=1, finalize=1)
+
+
+if __name__ == "__main__":
+    test_select_stages()
+    test_unchanged_inputs_reuse_checkpoints()
+    test_changes_rerun_downstream_stages()
+    test_start_and_stop()
+    test_checkpoints_disabled()
+    print("pipeline_dag tests passed")
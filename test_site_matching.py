@@ -0,0 +1,369 @@
+"""
+Regression tests for backend/site_matching.py: each matcher must return
+what the matching function it replaced returned.
+
+The baseline functions below are copied unchanged from the original
+grid_and_primary_calculated.py (it cannot be imported: the script connects
+to the database on import).
+
+Run with: python -m pytest test_site_matching.py
+"""
+
+import contextlib
+import io
+import os
+import random
+import re
+import sys
+import warnings
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import site_matching  # noqa: E402
+
+
+# ============================================================================
+# BASELINE IMPLEMENTATIONS
+# ============================================================================
+
+def normalize_site_location(site_loc):
+    if pd.isna(site_loc):
+        return ""
+    return str(site_loc).replace("-", "").strip().upper()
+
+# Enhanced function to find LTDS matches with multiple strategies
+def find_ltds_match(site_loc, ltds_df):
+    """Find LTDS data for a site using multiple matching strategies"""
+    if pd.isna(site_loc) or site_loc == '':
+        return None
+    
+    site_clean = str(site_loc).strip()
+    site_normalized = normalize_site_location(site_loc)
+    
+    # Strategy 1: Exact match
+    exact_match = ltds_df[ltds_df['sitefunctionallocation'] == site_clean]
+    if len(exact_match) > 0:
+        return exact_match.iloc[0]['installedcapacity_mva']
+    
+    # Strategy 2: Normalized match
+    normalized_match = ltds_df[ltds_df['sitefunctionallocation_normalized'] == site_normalized]
+    if len(normalized_match) > 0:
+        return normalized_match.iloc[0]['installedcapacity_mva']
+    
+    # Strategy 3: Partial match (contains)
+    partial_matches = ltds_df[ltds_df['sitefunctionallocation'].str.contains(site_clean, case=False, na=False)]
+    if len(partial_matches) > 0:
+        return partial_matches.iloc[0]['installedcapacity_mva']
+    
+    # Strategy 4: Reverse partial match (site contains LTDS)
+    reverse_matches = ltds_df[ltds_df['sitefunctionallocation'].apply(lambda x: site_clean in str(x) if pd.notna(x) else False)]
+    if len(reverse_matches) > 0:
+        return reverse_matches.iloc[0]['installedcapacity_mva']
+    
+    return None
+
+
+def comprehensive_site_matching(dnoa_site, df_final_sites, min_keyword_length=3):
+    """
+    Multi-strategy matching prioritizing first word as main location identifier:
+    1. Exact match
+    2. First word match (highest priority)
+    3. Substring matching
+    4. Multi-keyword matching (as backup)
+    5. Number/code matching
+    6. High-threshold fuzzy matching
+    """
+    if pd.isna(dnoa_site) or dnoa_site == '':
+        return None, 0, 'no_input'
+    
+    dnoa_site_clean = str(dnoa_site).strip().upper()
+    print(f"DEBUG: Trying to match DNOA site: '{dnoa_site}'")
+    
+    # Extract first meaningful word from DNOA site
+    dnoa_words = re.findall(r'\b[A-Z]+\b', dnoa_site_clean)
+    common_prefixes = {'THE', 'A', 'AN'}  # Very common words to skip
+    dnoa_first_word = None
+    
+    for word in dnoa_words:
+        if len(word) >= 3 and word not in common_prefixes:  # First meaningful word
+            dnoa_first_word = word
+            break
+    
+    print(f"DEBUG: DNOA first word identified: '{dnoa_first_word}'")
+    
+    best_match = None
+    best_score = 0
+    match_method = None
+    
+    for final_site in df_final_sites:
+        if pd.isna(final_site) or final_site == '':
+            continue
+            
+        final_site_clean = str(final_site).strip().upper()
+        
+        # Strategy 1: Exact match (case insensitive)
+        if dnoa_site_clean == final_site_clean:
+            return final_site, 1.0, 'exact_match'
+        
+        # Strategy 2: First word match (HIGHEST PRIORITY)
+        if dnoa_first_word:
+            final_words = re.findall(r'\b[A-Z]+\b', final_site_clean)
+            final_first_word = None
+            
+            for word in final_words:
+                if len(word) >= 3 and word not in common_prefixes:
+                    final_first_word = word
+                    break
+            
+            if final_first_word and dnoa_first_word == final_first_word:
+                # Perfect first word match - give high score
+                first_word_score = 0.9
+                
+                # Bonus if it appears at the beginning of the string
+                if final_site_clean.startswith(final_first_word):
+                    first_word_score = 0.95
+                
+                # Additional small bonus for other word matches
+                dnoa_other_words = set(dnoa_words[1:]) if len(dnoa_words) > 1 else set()
+                final_other_words = set(final_words[1:]) if len(final_words) > 1 else set()
+                
+                if dnoa_other_words and final_other_words:
+                    common_other_words = dnoa_other_words & final_other_words
+                    if common_other_words:
+                        first_word_score += 0.05  # Small bonus for additional matches
+                
+                if first_word_score > best_score:
+                    best_match = final_site
+                    best_score = first_word_score
+                    match_method = f'first_word_match_{dnoa_first_word}'
+                    print(f"DEBUG: First word match found - '{dnoa_first_word}' in both '{dnoa_site}' and '{final_site}'")
+        
+        # Strategy 3: Full substring match (lower priority than first word)
+        if dnoa_site_clean in final_site_clean:
+            score = len(dnoa_site_clean) / len(final_site_clean) * 0.7  # Reduce weight
+            if score > best_score:
+                best_match = final_site
+                best_score = score
+                match_method = 'substring_dnoa_in_final'
+        elif final_site_clean in dnoa_site_clean:
+            score = len(final_site_clean) / len(dnoa_site_clean) * 0.7  # Reduce weight
+            if score > best_score:
+                best_match = final_site
+                best_score = score
+                match_method = 'substring_final_in_dnoa'
+        
+        # Strategy 4: Multi-keyword matching (backup for complex cases)
+        common_words = {'THE', 'AND', 'OR', 'OF', 'IN', 'AT', 'TO', 'FOR', 'WITH', 'BY', 'FROM', 'ON', 
+                       'MILL', 'HILL', 'ROAD', 'STREET', 'LANE', 'AVENUE', 'DRIVE', 'CLOSE', 'WAY',
+                       'PRIMARY', 'SECONDARY', 'SUBSTATION', 'STATION', 'SUB', 'STN',
+                       'KV', 'KILOVOLT', '33', '11', '132', '275', '400', '66', '22'}
+        
+        dnoa_all_words = set(re.findall(r'\b[A-Z]+\b', dnoa_site_clean))
+        final_all_words = set(re.findall(r'\b[A-Z]+\b', final_site_clean))
+        
+        dnoa_keywords = {word for word in dnoa_all_words if len(word) >= min_keyword_length and word not in common_words}
+        final_keywords = {word for word in final_all_words if len(word) >= min_keyword_length and word not in common_words}
+        
+        if dnoa_keywords and final_keywords:
+            matching_keywords = dnoa_keywords & final_keywords
+            if len(matching_keywords) >= 2:  # Require at least 2 keyword matches
+                keyword_score = len(matching_keywords) / max(len(dnoa_keywords), len(final_keywords))
+                keyword_score *= 0.6  # Lower weight than first word match
+                
+                if keyword_score > best_score:
+                    best_match = final_site
+                    best_score = keyword_score
+                    match_method = f'multi_keyword_match_{list(matching_keywords)}'
+        
+        # Strategy 5: Number/code matching
+        dnoa_numbers = set(re.findall(r'\b\d+\b', dnoa_site_clean))
+        final_numbers = set(re.findall(r'\b\d+\b', final_site_clean))
+        
+        if dnoa_numbers and final_numbers:
+            matching_numbers = dnoa_numbers & final_numbers
+            if matching_numbers and len(matching_numbers) >= 1:
+                text_similarity = SequenceMatcher(None, dnoa_site_clean, final_site_clean).ratio()
+                if text_similarity > 0.3:
+                    number_score = (len(matching_numbers) / max(len(dnoa_numbers), len(final_numbers))) * 0.4 + text_similarity * 0.2
+                    if number_score > best_score:
+                        best_match = final_site
+                        best_score = number_score
+                        match_method = f'number_text_match_{list(matching_numbers)}'
+        
+        # Strategy 6: High-threshold fuzzy matching (last resort)
+        fuzzy_similarity = SequenceMatcher(None, dnoa_site_clean, final_site_clean).ratio()
+        if fuzzy_similarity > 0.8 and fuzzy_similarity > best_score:  # Very high threshold
+            best_match = final_site
+            best_score = fuzzy_similarity * 0.5  # Lower weight
+            match_method = 'fuzzy_high_threshold'
+    
+    if best_match and best_score > 0.1:
+        print(f"DEBUG: Match found - '{dnoa_site}' -> '{best_match}' (Method: {match_method}, Score: {best_score:.3f})")
+        return best_match, best_score, match_method
+    
+    print(f"DEBUG: No match found for '{dnoa_site}'")
+    return None, 0, 'no_match'
+
+
+def fuzzy_match_gsp(main_gsp, overview_gsp_list, threshold=0.6):
+    """
+    Find the best fuzzy match for a Grid Supply Point name
+    Returns (best_match, similarity_score) or (None, 0) if no good match
+    """
+    if pd.isna(main_gsp) or main_gsp == '':
+        return None, 0
+    
+    main_gsp_clean = str(main_gsp).strip().upper()
+    best_match = None
+    best_score = 0
+    
+    for overview_gsp in overview_gsp_list:
+        if pd.isna(overview_gsp) or overview_gsp == '':
+            continue
+            
+        overview_gsp_clean = str(overview_gsp).strip().upper()
+        
+        # Exact match (case insensitive)
+        if main_gsp_clean == overview_gsp_clean:
+            return overview_gsp, 1.0
+        
+        # Partial match - check if overview name is contained in main name or vice versa
+        if overview_gsp_clean in main_gsp_clean or main_gsp_clean in overview_gsp_clean:
+            score = max(len(overview_gsp_clean) / len(main_gsp_clean), 
+                       len(main_gsp_clean) / len(overview_gsp_clean))
+            if score > best_score:
+                best_match = overview_gsp
+                best_score = score
+        
+        # Similarity-based matching
+        similarity = SequenceMatcher(None, main_gsp_clean, overview_gsp_clean).ratio()
+        if similarity > best_score and similarity >= threshold:
+            best_match = overview_gsp
+            best_score = similarity
+    
+    return best_match, best_score
+
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+def call(function, *args):
+    """Result of function(*args), or the exception type it raised"""
+    try:
+        return function(*args)
+    except re.error:
+        return re.error
+
+
+LTDS_PARTS = ['AB', 'ab', 'C', '-', '1', '2', '.', ' ', 'x', '(', 'ſ', 'K', 'ı', 'I', '[', ']', '*']
+
+
+def random_location(rng):
+    r = rng.random()
+    if r < 0.05:
+        return None
+    if r < 0.08:
+        return np.nan
+    if r < 0.11:
+        return rng.choice([12, 3.5])
+    return ''.join(rng.choice(LTDS_PARTS) for _ in range(rng.randint(0, 5)))
+
+
+def test_ltds_matcher():
+    for seed in range(200):
+        rng = random.Random(seed)
+        ltds = pd.DataFrame({'sitefunctionallocation': [random_location(rng) for _ in range(rng.randint(1, 40))]})
+        ltds['installedcapacity_mva'] = [float(i + 1) for i in range(len(ltds))]
+        ltds['sitefunctionallocation_normalized'] = ltds['sitefunctionallocation'].apply(normalize_site_location)
+        matcher = site_matching.LtdsMatcher(ltds)
+        queries = [random_location(rng) for _ in range(20)] + list(ltds['sitefunctionallocation'][:10]) + [' ', '']
+        for site in queries:
+            with warnings.catch_warnings():
+                # Sites are used as regexes; '[' patterns warn about nested sets
+                warnings.simplefilter("ignore", FutureWarning)
+                try:
+                    expected = find_ltds_match(site, ltds)
+                except re.error:
+                    expected = re.error
+                except AttributeError:
+                    # str.contains on a non-string site: the baseline crashed here
+                    continue
+                assert call(matcher.match, site) == expected, (site, list(ltds['sitefunctionallocation']))
+
+
+SITE_WORDS = ['THE', 'A', 'AN', 'MILL', 'HILL', 'NORTH', 'SOUTH', 'GREEN', 'PARK', 'ROAD', 'ST', 'PRIMARY', '33', '11',
+              '132', '7', 'KV', 'OAK', 'ELM', 'WOOD', 'BRIDGE', 'NEW', 'TOWN', 'ABC1', 'É', '-', '/', '1A', 'street', 'oak']
+
+
+def random_site_name(rng):
+    if rng.random() < 0.03:
+        return rng.choice(['', '  ', 5])
+    return ' ' * rng.randint(0, 1) + ' '.join(rng.choice(SITE_WORDS) for _ in range(rng.randint(1, 4)))
+
+
+def baseline_dnoa_match(dnoa_site, sites):
+    # The baseline prints a DEBUG line per candidate
+    with contextlib.redirect_stdout(io.StringIO()):
+        return comprehensive_site_matching(dnoa_site, sites)
+
+
+def test_dnoa_matcher():
+    for seed in range(150):
+        rng = random.Random(seed)
+        sites = [random_site_name(rng) for _ in range(rng.randint(1, 80))]
+        matcher = site_matching.DnoaMatcher(sites)
+        queries = [random_site_name(rng) for _ in range(15)] + sites[:5] + [None, np.nan, '']
+        for dnoa_site in queries:
+            expected = baseline_dnoa_match(dnoa_site, sites)
+            result = matcher.match(dnoa_site)
+            assert result == expected and type(result[0]) is type(expected[0]), (dnoa_site, sites)
+
+
+def test_dnoa_matcher_precompute():
+    rng = random.Random(1)
+    sites = [random_site_name(rng) for _ in range(300)]
+    # Enough distinct queries (MIN_PARALLEL_QUERIES) to go through the process pool
+    queries = [random_site_name(rng) for _ in range(150)]
+    matcher = site_matching.DnoaMatcher(sites)
+    matcher.precompute(queries, workers=2)
+    assert len(matcher.memo) >= site_matching.MIN_PARALLEL_QUERIES
+    assert [matcher.match(query) for query in queries] == [baseline_dnoa_match(query, sites) for query in queries]
+
+
+GSP_WORDS = ['BARKING', 'BRAMFORD', 'BURWELL', 'MAIN', 'GRID', 'GSP', '132', 'kV', 'EAST', 'WEST', 'SELLINDGE',
+             'NORTHFLEET', 'B', 'A']
+
+
+def random_gsp_name(rng):
+    if rng.random() < 0.03:
+        return rng.choice(['', None])
+    return ' '.join(rng.choice(GSP_WORDS) for _ in range(rng.randint(1, 3))) + rng.choice(['', ' ', 'x'])
+
+
+def test_gsp_matcher():
+    for seed in range(200):
+        rng = random.Random(seed)
+        candidates = [random_gsp_name(rng) for _ in range(rng.randint(1, 60))]
+        matcher = site_matching.GspMatcher(candidates, threshold=0.6)
+        queries = [random_gsp_name(rng) for _ in range(15)] + candidates[:5]
+        for name in queries:
+            assert matcher.match(name) == fuzzy_match_gsp(name, candidates, 0.6), (name, candidates)
+
+
+def test_normalize_site_location():
+    for value in [None, np.nan, '', ' a-b-c ', 'spn-s00001', 12, 'ß-x', 'ı-i']:
+        assert site_matching.normalize_site_location(value) == normalize_site_location(value)
+
+
+if __name__ == "__main__":
+    test_ltds_matcher()
+    test_dnoa_matcher()
+    test_dnoa_matcher_precompute()
+    test_gsp_matcher()
+    test_normalize_site_location()
+    print("site matchers match the baseline functions")